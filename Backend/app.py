@@ -1,11 +1,12 @@
 from flask import Flask, request, jsonify, redirect, url_for
 import os
+import sys
 import subprocess
-import pandas as pd
+import threading
 import uuid
-from inference import Inference 
+from resource_governor import ResourceGovernor, ResourceBusy
+from metrics import METRICS
 from database import Database
-from PIL import Image
 from flask_cors import CORS
 import pytz
 from datetime import datetime
@@ -22,6 +23,45 @@ CORS(app)
 
 db = Database()
 
+# The ML stack (torch, ultralytics, cv2) and pandas are imported inside the routes that need them,
+# so the app starts fast and the read-only routes never load them.
+# INFERENCE_BACKEND=onnx serves the exported ONNX models (see export_models.py)
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch')
+# INFERENCE_QUIET=1 turns off the per-frame logging of inference runs
+INFERENCE_VERBOSE = os.environ.get('INFERENCE_QUIET', '0') != '1'
+
+
+# When to load and warm up the detector and classifier, in a background thread; see /ready
+INFERENCE_WARM_UP = os.environ.get('INFERENCE_WARM_UP', '')
+_warm_up_lock = threading.Lock()
+_warm_up_thread = None
+
+
+def _warm_up_models():
+    from model_registry import MODELS
+    MODELS.warm_up(backend=INFERENCE_BACKEND)
+
+
+def start_warm_up():
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=_warm_up_models, name="model-warmup", daemon=True)
+            _warm_up_thread.start()
+
+
+# Opt-in at import: every Flask worker would otherwise pay for torch and the models on startup
+if INFERENCE_WARM_UP == '1':
+    start_warm_up()
+
+# Inference jobs in this process; extra requests wait for a slot, or get 503 when the memory budget is too small.
+# One job at a time: jobs here share one detector, which detector_session holds for a whole video, so a
+# second admitted job would only block while holding its lease. Parallel jobs go through batch_inference.
+GOVERNOR = ResourceGovernor(
+    max_jobs=1,
+    memory_budget_mb=float(os.environ['INFERENCE_MEMORY_BUDGET_MB']) if os.environ.get('INFERENCE_MEMORY_BUDGET_MB') else None
+)
+
 root_dir = 'static'
 UPLOAD_FOLDER = os.path.join(root_dir, 'input_video')
 temp_folder = os.path.join(root_dir, 'temp')
@@ -36,6 +76,27 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 def index():
     return jsonify(message='Welcome to the API')
 
+# Readiness of the models for /start_inference. INFERENCE_WARM_UP picks when they are loaded:
+#   unset (default)  on the first /ready probe, which answers 503 until the warm-up has finished
+#   1                at startup, in every worker process
+#   0                never in advance: the first inference request loads them (e.g. a dashboard-only instance)
+@app.route('/ready')
+def ready():
+    if INFERENCE_WARM_UP != '0':
+        start_warm_up()
+    registry = sys.modules.get('model_registry')
+    if registry is None:
+        status = {'ready': False, 'loaded': [], 'warmup_seconds': {}, 'error': None}
+    else:
+        status = registry.MODELS.status()
+    status['resources'] = GOVERNOR.stats()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/metrics')
+def metrics():
+    # Stage latency histograms and counters of the videos processed by this process, for Prometheus to scrape
+    return METRICS.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/upload', methods=['POST'])
 def upload():
     try:
@@ -75,18 +136,36 @@ def start_inference():
     print(f"Requested video: {filename}")
 
     try:
+        from inference import Inference
+
         video_path = os.path.join(root_dir, filename)
         video_path = os.path.normpath(video_path)
 
+        # analytics_only=true only stores the events: no annotated video, no re-encode
+        analytics_only = request.form.get('analytics_only', '').lower() in ('1', 'true', 'yes')
+
         output_path = os.path.join(annotated_folder, os.path.basename(filename))
         print(f"Output will be saved to: {output_path}")
 
-        inf = Inference(video_path, output_path)
-        inf.inference()
+        try:
+            lease = GOVERNOR.acquire()
+        except ResourceBusy as e:
+            return jsonify(message=f'Busy: {e}'), 503
+        inf = None
+        try:
+            inf = Inference(video_path, output_path, analytics_only=analytics_only, backend=INFERENCE_BACKEND,
+                            decode_threads=lease.threads, verbose=INFERENCE_VERBOSE)
+            inf.inference()
+        finally:
+            # Jobs share this process, so only the memory a job added counts against the budget
+            GOVERNOR.release(lease, name=filename, peak_rss_mb=getattr(inf, 'rss_increase_mb', None))
+
+        if analytics_only:
+            return jsonify(message='Inference completed (analytics only)', video_name=None)
 
         db.insert_cow_Video_Infomation_data(output_video=os.path.splitext(os.path.basename(output_path))[0])
 
-        return jsonify(message='Inference completed', video_name=output_path)
+        return jsonify(message='Inference completed', video_name=inf.browser_output_path)
     except Exception as e:
         return jsonify(message=f'Error: {str(e)}')
 
@@ -98,6 +177,7 @@ def get_all_events():
         activity_filter = request.args.get('activity')   # e.g., 'Brushing'
         limit = request.args.get('limit', type=int)      # e.g., 100
         cow_id_filter = request.args.get('cow_id')       # optional filter by cow ID
+        import pandas as pd
 
         result = db.get_all_cow_events()
         df = pd.DataFrame(result, columns=['Cow-ID', 'Activity-Type', 'Duration', 'Video-Name', 'Date', 'Time', 'Camera'])
@@ -179,13 +259,15 @@ def get_all_videos():
             video_time = f"{time_parts[0]}:{time_parts[1]}"
 
             annotated_path = os.path.join(annotated_folder, f"{os.path.splitext(video_name)[0]}.mp4")
-            print(f"🔍 Checking for annotated video: {annotated_path} → {os.path.exists(annotated_path)}")
+            browser_path = os.path.join(annotated_folder, f"{os.path.splitext(video_name)[0]}_fixed.mp4")
+            processed = os.path.exists(annotated_path) or os.path.exists(browser_path)
+            print(f"🔍 Checking for annotated video: {browser_path} → {processed}")
 
 
             videos.append({
                 "Video-Name": video_name,
                 "Preview-Video": f"input_video/{video_name}",
-                "Inference-Status": "Processed" if os.path.exists(annotated_path) else "Not Processed",
+                "Inference-Status": "Processed" if processed else "Not Processed",
                 "video-Date": video_date,
                 "video-Time": video_time
             })
@@ -203,6 +285,7 @@ def serve_dataset_image(filename):
 @app.route('/get_cow_images', methods=['POST','GET'])
 def get_cow_images():
     try:
+        import pandas as pd
         cluster_dict = training_image_clusters()
         response = db.get_cow_image_paths()
         df = pd.DataFrame(response, columns = ['Cow-ID', 'Video-Name', 'Date', 'Image-Paths','Cluster'])
@@ -0,0 +1,239 @@
+"""Run Inference over a directory (or glob) of Event*.mp4 recordings with a pool of worker processes.
+
+Run from the repository root, like the Flask app:
+
+    python Backend/batch_inference.py static/input_video --workers 4 --analytics-only
+
+Every finished video gets a summary JSON in --summary-dir. Videos whose summary
+says "done" are skipped on the next run, so an interrupted batch resumes where it
+stopped; a video that was cut off mid-run is processed again from the start
+(inference() first deletes its old events, so nothing is counted twice). A worker
+process that dies (out of memory, a crash in a native decoder) fails the videos
+that were in the pool; the rest of the batch goes on in a new pool.
+
+A ResourceGovernor splits the CPUs between the running videos and, with
+--memory-budget-mb, holds videos back while the running ones would not leave room.
+"""
+import argparse
+import collections
+import concurrent.futures
+import glob
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures.process import BrokenProcessPool
+from resource_governor import ResourceGovernor, apply_thread_budget
+
+VIDEO_PATTERN = 'Event*.mp4'
+
+
+def find_videos(inputs):
+    videos = []
+    for item in inputs:
+        if os.path.isdir(item):
+            videos.extend(glob.glob(os.path.join(item, VIDEO_PATTERN)))
+        else:
+            videos.extend(glob.glob(item))
+    # Same video given twice (dir and glob) is only run once
+    return sorted(set(os.path.normpath(v) for v in videos))
+
+
+def summary_path(summary_dir, video_path):
+    return os.path.join(summary_dir, os.path.splitext(os.path.basename(video_path))[0] + '.json')
+
+
+def load_summary(summary_dir, video_path):
+    try:
+        with open(summary_path(summary_dir, video_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_summary(path, summary):
+    # Write then rename so an interrupted run never leaves a half-written summary behind
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def init_worker(threads):
+    """Give each worker its own thread budget, before torch or cv2 are imported in it"""
+    apply_thread_budget(threads)
+
+
+def run_video(video_path, summary_dir, output_dir, inference_kwargs, threads=None, cpus=None):
+    """Process one video in a worker and return its summary; failures are reported, not raised"""
+    if threads:
+        apply_thread_budget(threads, cpus)
+    from inference import Inference
+
+    name = os.path.splitext(os.path.basename(video_path))[0]
+    summary = {'video': video_path, 'status': 'failed', 'worker_pid': os.getpid(), 'threads': threads, 'cpus': cpus}
+    start = time.time()
+    try:
+        kwargs = dict(inference_kwargs, decode_threads=threads or 0)
+        inf = Inference(video_path, os.path.join(output_dir, f'{name}.mp4'), **kwargs)
+        inf.headbutt_csv_path = os.path.join(summary_dir, f'{name}_headbutts.csv')
+        inf.inference()
+        if not hasattr(inf, 'throughput'):
+            raise RuntimeError(f"Could not open video {video_path}")
+        summary.update(
+            status='done',
+            frames=inf.frame_idx,
+            video_fps=inf.fps,
+            throughput_fps=round(inf.throughput, 2),
+            events=dict(collections.Counter(event['event_type'] for event in inf.events)),
+            headbutts=len(inf.headbutt_log),
+            output=inf.browser_output_path if inf.annotate else None,
+            peak_rss_mb=round(inf.peak_rss_mb, 1),
+            stage_seconds={stage: m['seconds'] for stage, m in inf.metrics['stages'].items()},
+            metrics=inf.metrics_path,
+        )
+    except Exception as e:
+        summary['error'] = f"{type(e).__name__}: {e}"
+        summary['traceback'] = traceback.format_exc()
+    summary['elapsed_seconds'] = round(time.time() - start, 2)
+    summary['finished_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    write_summary(summary_path(summary_dir, video_path), summary)
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run cow behaviour inference on many videos in parallel")
+    parser.add_argument('inputs', nargs='+', help=f"directories (searched for {VIDEO_PATTERN}) or glob patterns")
+    parser.add_argument('--workers', type=int, default=1, help="number of worker processes")
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help="torch/OpenCV threads per worker (default: CPU count / workers)")
+    parser.add_argument('--output-dir', default=os.path.join('static', 'annotated_video'))
+    parser.add_argument('--summary-dir', default=os.path.join('static', 'batch_summaries'))
+    parser.add_argument('--memory-budget-mb', type=float, default=None,
+                        help="queue videos while the running ones would need more memory than this")
+    parser.add_argument('--job-memory-mb', type=float, default=1500,
+                        help="memory estimate of one worker, raised to the largest peak RSS seen")
+    parser.add_argument('--pin-cpus', action='store_true', help="give every running video its own CPUs")
+    parser.add_argument('--force', action='store_true', help="also rerun videos that already have a done summary")
+    parser.add_argument('--analytics-only', action='store_true', help="skip drawing and the annotated video")
+    parser.add_argument('--detection-stride', type=int, default=1)
+    parser.add_argument('--motion-threshold', type=float, default=None)
+    parser.add_argument('--detection-batch-size', type=int, default=1, help="keyframes per detector forward pass")
+    parser.add_argument('--frame-reader', choices=('opencv', 'ffmpeg'), default='opencv')
+    parser.add_argument('--decode-width', type=int, default=None)
+    parser.add_argument('--backend', choices=('torch', 'onnx', 'int8'), default='torch', help="model runtime")
+    parser.add_argument('--model-path', default=None, help="detector weights (default: the backend's artifact)")
+    parser.add_argument('--quiet', action='store_true', help="no per-frame logging from the detector and the rules")
+    return parser.parse_args(argv)
+
+
+def main(argv=None, worker=run_video):
+    """worker replaces run_video in the pool (same arguments); it has to be importable by name, as the workers are spawned"""
+    args = parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+    os.makedirs(args.summary_dir, exist_ok=True)
+
+    videos = find_videos(args.inputs)
+    if not videos:
+        print(f" No videos found in {args.inputs}")
+        return 1
+    pending = [v for v in videos if args.force or (load_summary(args.summary_dir, v) or {}).get('status') != 'done']
+    print(f" {len(videos)} videos, {len(videos) - len(pending)} already done, {len(pending)} to process")
+
+    workers = max(1, min(args.workers, len(pending) or 1))
+    governor = ResourceGovernor(max_jobs=workers, memory_budget_mb=args.memory_budget_mb, job_memory_mb=args.job_memory_mb,
+                                pin_cpus=args.pin_cpus)
+    threads = args.threads_per_worker or governor.threads_per_job
+    inference_kwargs = {
+        'model_path': args.model_path,
+        'backend': args.backend,
+        'analytics_only': args.analytics_only,
+        'detection_stride': args.detection_stride,
+        'motion_threshold': args.motion_threshold,
+        'detection_batch_size': args.detection_batch_size,
+        'frame_reader': args.frame_reader,
+        'decode_width': args.decode_width,
+        'verbose': not args.quiet,
+    }
+
+    failed = 0
+    queued = list(pending)
+    running = {}
+
+    def report(video, summary):
+        if summary['status'] == 'done':
+            print(f" done   {video}: {summary['frames']} frames at {summary['throughput_fps']} frames/sec, "
+                  f"events {summary['events']}, peak RSS {summary['peak_rss_mb']} MB")
+            return 0
+        print(f" failed {video}: {summary['error']}")
+        return 1
+
+    def new_pool():
+        # spawn, so every worker starts clean and init_worker runs before torch is imported
+        return concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                                      initializer=init_worker, initargs=(threads,))
+
+    pool = new_pool()
+    try:
+        while queued or running:
+            broken = False
+            # Start videos while the governor has room; the rest wait for a running one to finish
+            while queued:
+                lease = governor.try_acquire()
+                if lease is None:
+                    break
+                video = queued.pop(0)
+                try:
+                    future = pool.submit(worker, video, args.summary_dir, args.output_dir, inference_kwargs, threads, lease.cpus)
+                except BrokenProcessPool:
+                    # A worker died since the last wait; this video never started, so it goes back in the queue
+                    governor.release(lease)
+                    queued.insert(0, video)
+                    broken = True
+                    break
+                running[future] = (video, lease)
+            if not running and not broken:
+                # Nothing is running and there is still no room: the job alone exceeds the memory budget
+                video = queued.pop(0)
+                summary = {'video': video, 'status': 'failed',
+                           'error': f"needs about {governor.job_memory_mb:.0f} MB, budget is {governor.memory_budget_mb} MB"}
+                write_summary(summary_path(args.summary_dir, video), summary)
+                failed += report(video, summary)
+                continue
+
+            # A dead worker breaks the whole pool: every video still in it fails with BrokenProcessPool
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                video, lease = running.pop(future)
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    # The worker process itself died (e.g. out of memory); record it so the video is retried next run
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                    summary = {'video': video, 'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+                    write_summary(summary_path(args.summary_dir, video), summary)
+                governor.release(lease, name=video, peak_rss_mb=summary.get('peak_rss_mb'))
+                failed += report(video, summary)
+            if broken and not running:
+                print(" A worker process died; starting a new pool for the remaining videos")
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = new_pool()
+    finally:
+        pool.shutdown()
+
+    batch = [load_summary(args.summary_dir, v) or {'video': v, 'status': 'missing'} for v in videos]
+    write_summary(os.path.join(args.summary_dir, 'batch_summary.json'), {
+        'videos': len(videos),
+        'done': sum(s.get('status') == 'done' for s in batch),
+        'failed': sum(s.get('status') == 'failed' for s in batch),
+        'frames': sum(s.get('frames', 0) for s in batch),
+        'resources': governor.stats(),
+        'summaries': batch,
+    })
+    print(f" Batch finished: {len(pending) - failed} processed, {failed} failed, summaries in {args.summary_dir}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
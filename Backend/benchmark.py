@@ -0,0 +1,719 @@
+"""CPU benchmarks for the inference backend.
+
+    python Backend/benchmark.py --output results.json [--compare baseline.json] [--quick]
+
+runs the offline suite (no model weights, no network) and writes the results as
+JSON; with --compare it lists the metrics that got worse than the baseline by
+more than --tolerance and exits with 1. The other functions here need a real
+video or the trained models and are run by hand.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import collections
+import contextlib
+import platform
+import tempfile
+import subprocess
+import cv2
+import numpy as np
+import torch
+from classificationmodel import CowClassifier
+from database import Database
+from geometry import FrameGeometry
+from utils import calculate_centroid, calculate_centroid_distance, are_boxes_overlapping, calculate_iou, convert_to_top_left_v1
+
+
+def random_cow_crops(count, seed=0):
+    """BGR crops with the sizes we usually get from the barn cameras"""
+    rng = np.random.default_rng(seed)
+    crops = []
+    for _ in range(count):
+        h = int(rng.integers(120, 400))
+        w = int(rng.integers(160, 500))
+        crops.append(rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8))
+    return crops
+
+
+def benchmark_classifier_batches(batch_sizes=(1, 8, 32), num_crops=256, repeats=3):
+    """Crops/sec of CowClassifier on CPU for each batch size"""
+    classifier = CowClassifier()  # random weights, only the timing matters
+    crops = random_cow_crops(num_crops)
+    results = {}
+    for batch_size in batch_sizes:
+        classifier.batch_size = batch_size
+        classifier.predict(crops[:batch_size])  # warm-up
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            classifier.predict(crops)
+            best = min(best, time.perf_counter() - start)
+        results[batch_size] = num_crops / best
+        print(f" batch size {batch_size:>3}: {results[batch_size]:8.1f} crops/sec")
+    return results
+
+
+def benchmark_preprocessing(num_crops=256, repeats=3, mean_tolerance=0.05):
+    """Crops/sec of the OpenCV/NumPy crop preprocessing against the PIL/torchvision transform, and their parity.
+
+    The two resizers differ slightly at the pixel level (INTER_AREA against PIL's
+    antialiased bilinear), so parity is checked on the mean absolute difference of
+    the normalized tensors, with the max difference reported alongside. The crops
+    are rendered cows rather than noise, which no resizer can agree on.
+    """
+    from synthetic_scene import scene_crops
+
+    classifier = CowClassifier()
+    crops = scene_crops(num_crops)
+    results = {}
+    for name, preprocess in (('torchvision', classifier.preprocess_torchvision), ('opencv', classifier.preprocessor)):
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for offset in range(0, num_crops, classifier.batch_size):
+                preprocess(crops[offset:offset + classifier.batch_size])
+            best = min(best, time.perf_counter() - start)
+        results[f'{name}_crops_per_sec'] = num_crops / best
+
+    reference = classifier.preprocess_torchvision(crops[:classifier.batch_size])
+    fast = classifier.preprocessor(crops[:classifier.batch_size])
+    difference = (reference - fast).abs()
+    results['mean_abs_difference'] = float(difference.mean())
+    results['max_abs_difference'] = float(difference.max())
+    results['within_tolerance'] = results['mean_abs_difference'] <= mean_tolerance
+    print(f" preprocessing: torchvision {results['torchvision_crops_per_sec']:8.1f} crops/sec, "
+          f"opencv {results['opencv_crops_per_sec']:8.1f} crops/sec, "
+          f"mean |diff| {results['mean_abs_difference']:.4f}, max |diff| {results['max_abs_difference']:.3f}")
+    return results
+
+
+def random_boxes(count, rng, frame_size=(1920, 1080), min_size=40, max_size=400):
+    w, h = frame_size
+    x1 = rng.integers(0, w - max_size, count)
+    y1 = rng.integers(0, h - max_size, count)
+    sizes = rng.integers(min_size, max_size, (count, 2))
+    return np.stack((x1, y1, x1 + sizes[:, 0], y1 + sizes[:, 1]), axis=1)
+
+
+def _is_inside(small_box, big_box):
+    return small_box[0] >= big_box[0] and small_box[1] >= big_box[1] and small_box[2] <= big_box[2] and small_box[3] <= big_box[3]
+
+
+def _scalar_frame_geometry(cows, heads, brushes, tubs):
+    """The per-pair calls the behaviour rules used to make for one frame"""
+    for cow in cows:
+        cow_centroid = calculate_centroid(cow)
+        for brush in brushes:
+            calculate_centroid_distance(cow_centroid, calculate_centroid(brush))
+            are_boxes_overlapping(cow, brush)
+        for _ in range(2):  # drinking and headbutt both searched for the cow's head
+            for head in heads:
+                if _is_inside(head, cow):
+                    break
+        for tub in tubs:
+            are_boxes_overlapping(cow, tub)
+
+
+def _vectorized_frame_geometry(cows, heads, brushes, tubs):
+    xyxys = np.concatenate((cows, heads, brushes, tubs))
+    n_cows, n_heads, n_brushes = len(cows), len(heads), len(brushes)
+    cow_idx = np.arange(n_cows)
+    head_idx = np.arange(n_cows, n_cows + n_heads)
+    brush_idx = np.arange(n_cows + n_heads, n_cows + n_heads + n_brushes)
+    tub_idx = np.arange(n_cows + n_heads + n_brushes, len(xyxys))
+    geometry = FrameGeometry(xyxys)
+    geometry.distances(cow_idx, brush_idx)
+    geometry.overlaps(cow_idx, brush_idx)
+    geometry.first_inside(head_idx, cow_idx)
+    geometry.overlaps(cow_idx, tub_idx)
+
+
+def benchmark_geometry(box_counts=((10, 8, 2, 2), (20, 15, 2, 2), (40, 30, 4, 4)), repeats=500, seed=0):
+    """Per-frame time of the scalar utils calls against FrameGeometry for (cows, heads, brushes, tubs) counts"""
+    rng = np.random.default_rng(seed)
+    results = {}
+    for counts in box_counts:
+        cows, heads, brushes, tubs = (random_boxes(n, rng) for n in counts)
+        timings = {}
+        for name, fn in (('scalar', _scalar_frame_geometry), ('vectorized', _vectorized_frame_geometry)):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                fn(cows, heads, brushes, tubs)
+            timings[name] = (time.perf_counter() - start) / repeats * 1e6
+        results[counts] = timings
+        print(f" cows/heads/brushes/tubs {counts}: scalar {timings['scalar']:8.1f} us, "
+              f"vectorized {timings['vectorized']:8.1f} us per frame")
+    return results
+
+
+def event_agreement(reference, candidate, tolerance_frames=30):
+    """Fraction of events that pair up by type and overlapping frame range (within tolerance_frames)"""
+    if not reference and not candidate:
+        return 1.0
+    unmatched = list(candidate)
+    matched = 0
+    for event in reference:
+        for other in unmatched:
+            if other['event_type'] != event['event_type']:
+                continue
+            if other['start_frame'] - tolerance_frames <= event['end_frame'] and event['start_frame'] <= other['end_frame'] + tolerance_frames:
+                unmatched.remove(other)
+                matched += 1
+                break
+    return matched / max(len(reference), len(candidate))
+
+
+def benchmark_detection_stride(video_path, strides=(1, 2, 3, 5), **inference_kwargs):
+    """Throughput and event agreement against stride 1 for each detection stride.
+
+    Every run replaces the video's rows in CowEvents; stride 1 runs last so the
+    database ends up with the reference events.
+    """
+    from inference import Inference
+
+    runs = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for stride in sorted(set(strides) | {1}, reverse=True):
+            output_path = os.path.join(tmp_dir, f"stride_{stride}.mp4")
+            inf = Inference(video_path, output_path, detection_stride=stride, **inference_kwargs)
+            inf.inference()
+            runs[stride] = (inf.throughput, inf.events)
+
+    reference_events = runs[1][1]
+    results = {}
+    for stride in sorted(runs):
+        throughput, events = runs[stride]
+        results[stride] = {
+            'frames_per_sec': throughput,
+            'events': len(events),
+            'agreement': event_agreement(reference_events, events)
+        }
+        print(f" stride {stride}: {throughput:7.2f} frames/sec, {len(events)} events, "
+              f"agreement with stride 1: {results[stride]['agreement']:.1%}")
+    return results
+
+
+def benchmark_analytics_only(video_path, **inference_kwargs):
+    """Frames/sec of a full annotated run against an analytics-only run of the same video"""
+    from inference import Inference
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for analytics_only in (False, True):
+            output_path = os.path.join(tmp_dir, "annotated.mp4")
+            inf = Inference(video_path, output_path, analytics_only=analytics_only, **inference_kwargs)
+            start = time.perf_counter()
+            inf.inference()  # wall time includes flushing the ffmpeg encoder
+            elapsed = time.perf_counter() - start
+            results['analytics_only' if analytics_only else 'annotated'] = inf.frame_idx / elapsed if elapsed > 0 else 0
+
+    gain = results['analytics_only'] / results['annotated'] if results['annotated'] else float('nan')
+    print(f" annotated: {results['annotated']:7.2f} frames/sec, analytics only: {results['analytics_only']:7.2f} frames/sec "
+          f"({gain:.2f}x)")
+    return results
+
+
+def write_synthetic_video(path, num_frames=900, fps=30, frame_size=(640, 360), num_cows=4, seed=0):
+    """Short clip of cow-sized blobs drifting past a static brush and tub, for checks that need a real file"""
+    rng = np.random.default_rng(seed)
+    w, h = frame_size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, frame_size)
+    positions = rng.uniform((0, 0), (w - 120, h - 80), (num_cows, 2))
+    velocities = rng.uniform(-2, 2, (num_cows, 2))
+    for _ in range(num_frames):
+        frame = np.full((h, w, 3), 90, dtype=np.uint8)
+        cv2.rectangle(frame, (20, 20), (60, 60), (200, 60, 60), -1)  # brush
+        cv2.rectangle(frame, (w - 120, h - 60), (w - 20, h - 20), (60, 200, 200), -1)  # tub
+        positions = np.clip(positions + velocities, 0, (w - 120, h - 80))
+        velocities[(positions <= 0) | (positions >= (w - 120, h - 80))] *= -1
+        for x, y in positions.astype(int):
+            cv2.ellipse(frame, (x + 60, y + 40), (60, 35), 0, 0, 360, (30, 30, 30), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def compare_chunked_events(video_path=None, chunks=3, overlap_seconds=10.0, **inference_kwargs):
+    """Events of a sequential analytics-only run against the chunked, stitched run of the same video.
+
+    Without a video_path a synthetic clip is written first. Neither run touches
+    the database. Reports event agreement and the total duration per behaviour.
+    """
+    from inference import Inference
+    from chunked_inference import run_chunked
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if video_path is None:
+            video_path = write_synthetic_video(os.path.join(tmp_dir, "Event20240101120000001.mp4"))
+        sequential = Inference(video_path, analytics_only=True, **inference_kwargs)
+        sequential.store_events = False
+        sequential.inference()
+        chunked = run_chunked(video_path, chunks=chunks, overlap_seconds=overlap_seconds, store_events=False,
+                              **inference_kwargs)
+
+    def total_durations(events):
+        totals = {}
+        for event in events:
+            if event['event_type'] != 'Headbutt':
+                totals[event['event_type']] = round(totals.get(event['event_type'], 0.0) + event['event_value'], 2)
+        return totals
+
+    result = {
+        'sequential_events': len(sequential.events),
+        'chunked_events': len(chunked),
+        'agreement': event_agreement(sequential.events, chunked, tolerance_frames=0),
+        'sequential_durations': total_durations(sequential.events),
+        'chunked_durations': total_durations(chunked),
+    }
+    print(f" sequential {result['sequential_events']} events {result['sequential_durations']}, "
+          f"chunked ({chunks}) {result['chunked_events']} events {result['chunked_durations']}, "
+          f"agreement {result['agreement']:.1%}")
+    return result
+
+
+def read_video_frames(video_path, count):
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def _detector_outputs(model, frames):
+    outputs = []
+    start = time.perf_counter()
+    for frame in frames:
+        boxes = model.predict(frame, conf=0.3, verbose=False)[0].boxes
+        outputs.append((boxes.xyxy.cpu().numpy(), boxes.cls.cpu().numpy(), boxes.conf.cpu().numpy()))
+    return outputs, len(frames) / (time.perf_counter() - start)
+
+
+def _max_box_difference(reference, candidate):
+    """Largest coordinate difference between matching boxes (sorted by position), inf if the boxes differ in number or class"""
+    worst = 0.0
+    for (ref_xyxy, ref_cls, _), (cand_xyxy, cand_cls, _) in zip(reference, candidate):
+        if len(ref_xyxy) != len(cand_xyxy):
+            return float('inf')
+        if len(ref_xyxy) == 0:
+            continue
+        ref_order = np.lexsort(ref_xyxy.T[::-1])
+        cand_order = np.lexsort(cand_xyxy.T[::-1])
+        if not np.array_equal(ref_cls[ref_order], cand_cls[cand_order]):
+            return float('inf')
+        worst = max(worst, float(np.abs(ref_xyxy[ref_order] - cand_xyxy[cand_order]).max()))
+    return worst
+
+
+def benchmark_backends(video_path=None, num_frames=50, num_crops=256, box_tolerance=2.0, prob_tolerance=1e-3):
+    """Throughput and output parity of the torch and onnx backends, for the detector and the classifier.
+
+    Needs the exported artifacts (export_models.py --backend onnx). Frames come
+    from video_path, or from a synthetic clip without one.
+    """
+    from ultralytics import YOLO
+    from classificationmodel import OnnxCowClassifier
+    from model_registry import ARTIFACTS
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if video_path is None:
+            video_path = write_synthetic_video(os.path.join(tmp_dir, "synthetic.mp4"), num_frames=num_frames)
+        frames = read_video_frames(video_path, num_frames)
+
+    results = {}
+    detector_outputs = {}
+    for backend in ('torch', 'onnx'):
+        model = YOLO(ARTIFACTS[backend]['detector'], task='detect')
+        model.predict(frames[0], verbose=False)  # warm-up
+        detector_outputs[backend], fps = _detector_outputs(model, frames)
+        results[f'detector_{backend}_frames_per_sec'] = fps
+    results['detector_max_box_difference'] = _max_box_difference(detector_outputs['torch'], detector_outputs['onnx'])
+
+    crops = random_cow_crops(num_crops)
+    classifiers = {
+        'torch': CowClassifier(ARTIFACTS['torch']['classifier']),
+        'onnx': OnnxCowClassifier(ARTIFACTS['onnx']['classifier']),
+    }
+    probabilities = {}
+    for backend, classifier in classifiers.items():
+        classifier.predict(crops[:classifier.batch_size])  # warm-up
+        start = time.perf_counter()
+        probabilities[backend] = classifier.predict_proba(crops)
+        results[f'classifier_{backend}_crops_per_sec'] = num_crops / (time.perf_counter() - start)
+    results['classifier_max_prob_difference'] = float(np.abs(probabilities['torch'] - probabilities['onnx']).max())
+    results['classifier_top1_agreement'] = float((probabilities['torch'].argmax(1) == probabilities['onnx'].argmax(1)).mean())
+
+    results['within_tolerance'] = (results['detector_max_box_difference'] <= box_tolerance and
+                                   results['classifier_max_prob_difference'] <= prob_tolerance)
+    print(f" detector: torch {results['detector_torch_frames_per_sec']:7.2f} frames/sec, "
+          f"onnx {results['detector_onnx_frames_per_sec']:7.2f} frames/sec, "
+          f"max box difference {results['detector_max_box_difference']:.2f} px")
+    print(f" classifier: torch {results['classifier_torch_crops_per_sec']:7.1f} crops/sec, "
+          f"onnx {results['classifier_onnx_crops_per_sec']:7.1f} crops/sec, "
+          f"max probability difference {results['classifier_max_prob_difference']:.2e}, "
+          f"top-1 agreement {results['classifier_top1_agreement']:.1%}")
+    return results
+
+
+def benchmark_detection_batches(video_path=None, batch_sizes=(1, 4, 8, 16), num_frames=64, **inference_kwargs):
+    """Keyframe detection + ByteTrack frames/sec for each detection batch size (1 is the per-frame model.track path).
+
+    Batch sizes above 1 get the registry's 'predict' detector instance, so the
+    model.track() run of batch size 1 cannot leak its tracker into them.
+    """
+    from inference import Inference
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if video_path is None:
+            video_path = write_synthetic_video(os.path.join(tmp_dir, "synthetic.mp4"), num_frames=num_frames)
+        frames = read_video_frames(video_path, num_frames)
+
+    results = {}
+    for batch_size in batch_sizes:
+        inf = Inference(video_path, analytics_only=True, detection_batch_size=batch_size, **inference_kwargs)
+        with inf.models.detector_session(inf.model):
+            inf.detection_calls = 0
+            inf.batched_tracker = None
+            if batch_size > 1:
+                from byte_tracking import BatchedByteTracker
+                inf.batched_tracker = BatchedByteTracker(inf.model)
+            inf.detect_batch(frames[:batch_size])  # warm-up
+            start = time.perf_counter()
+            for offset in range(0, len(frames), batch_size):
+                inf.detect_batch(frames[offset:offset + batch_size])
+            results[batch_size] = len(frames) / (time.perf_counter() - start)
+        print(f" detection batch size {batch_size:>2}: {results[batch_size]:7.2f} frames/sec")
+    return results
+
+
+def _track_id_agreement(reference_tracks, candidate_tracks, min_iou=0.5):
+    """Fraction of reference cow boxes whose best-overlapping candidate box has the same track id"""
+    from utils import calculate_iou
+
+    total = agreed = 0
+    for frame_idx, tracks in reference_tracks.items():
+        candidates = candidate_tracks.get(frame_idx, {})
+        for tid, box in tracks.items():
+            total += 1
+            best = max(candidates.items(), key=lambda item: calculate_iou(box, item[1]), default=None)
+            if best is not None and best[0] == tid and calculate_iou(box, best[1]) >= min_iou:
+                agreed += 1
+    return agreed / total if total else 1.0
+
+
+def compare_batched_tracking(video_path=None, batch_size=8, tolerance=0.95, **inference_kwargs):
+    """Track ids and events of batched detection + standalone ByteTrack against per-frame model.track"""
+    from inference import Inference
+
+    runs = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if video_path is None:
+            video_path = write_synthetic_video(os.path.join(tmp_dir, "Event20240101120000001.mp4"))
+        for size in (1, batch_size):
+            inf = Inference(video_path, analytics_only=True, detection_batch_size=size, **inference_kwargs)
+            inf.store_events = False
+            inf.record_activity = True
+            inf.inference()
+            runs[size] = inf
+
+    reference, candidate = runs[1], runs[batch_size]
+    # The batched run must not inherit the tracking callbacks that model.track() leaves on its instance
+    assert reference.model is not candidate.model, "per-frame and batched runs share a detector instance"
+    result = {
+        'track_id_agreement': _track_id_agreement(reference.cow_tracks, candidate.cow_tracks),
+        'event_agreement': event_agreement(reference.events, candidate.events),
+        'frames_per_sec': {1: reference.throughput, batch_size: candidate.throughput},
+    }
+    result['within_tolerance'] = result['track_id_agreement'] >= tolerance and result['event_agreement'] >= tolerance
+    print(f" batch {batch_size} vs per-frame track: track id agreement {result['track_id_agreement']:.1%}, "
+          f"event agreement {result['event_agreement']:.1%}, "
+          f"{reference.throughput:.2f} -> {candidate.throughput:.2f} frames/sec")
+    return result
+
+
+HEAVY_MODULES = ('torch', 'torchvision', 'ultralytics', 'cv2', 'onnxruntime', 'pandas')
+
+
+def check_import_budget(module='app', budget_seconds=1.5, heavy_modules=HEAVY_MODULES, repeats=3):
+    """Cold-start check: import module in fresh interpreters and fail if it is slow or loads the heavy stack.
+
+    Runs with the default environment (INFERENCE_WARM_UP unset, so no model
+    warm-up at import) in a scratch directory (the app creates its static and
+    Database folders on import). Raises AssertionError on a regression.
+    """
+    script = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "seconds = time.perf_counter() - start\n"
+        f"print(json.dumps({{'seconds': seconds, 'heavy': [m for m in {list(heavy_modules)!r} if m in sys.modules]}}))\n"
+    )
+    env = {name: value for name, value in os.environ.items() if name != 'INFERENCE_WARM_UP'}
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, (os.path.dirname(os.path.abspath(__file__)), env.get('PYTHONPATH'))))
+    timings = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for _ in range(repeats):
+            out = subprocess.run([sys.executable, '-c', script], cwd=tmp_dir, env=env, check=True,
+                                 capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            timings.append(result['seconds'])
+            assert not result['heavy'], f"import {module} loaded {result['heavy']}"
+    best = min(timings)
+    print(f" import {module}: {best:.3f}s (budget {budget_seconds:.1f}s)")
+    assert best <= budget_seconds, f"import {module} took {best:.2f}s, over the {budget_seconds:.1f}s budget"
+    return best
+
+
+@contextlib.contextmanager
+def _working_directory(path):
+    # Database() and Inference keep their files under the current directory
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(previous)
+
+
+def _per_call_ns(fn, args_list, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for args in args_list:
+            fn(*args)
+    return (time.perf_counter() - start) / (repeats * len(args_list)) * 1e9
+
+
+def benchmark_utils(num_pairs=1000, repeats=50, seed=0):
+    """Nanoseconds per call of the scalar box helpers in utils.py"""
+    rng = np.random.default_rng(seed)
+    boxes_a = [tuple(box) for box in random_boxes(num_pairs, rng).tolist()]
+    boxes_b = [tuple(box) for box in random_boxes(num_pairs, rng).tolist()]
+    centroids_a = [calculate_centroid(box) for box in boxes_a]
+    centroids_b = [calculate_centroid(box) for box in boxes_b]
+    results = {
+        'calculate_centroid_ns': _per_call_ns(calculate_centroid, [(box,) for box in boxes_a], repeats),
+        'calculate_centroid_distance_ns': _per_call_ns(calculate_centroid_distance, list(zip(centroids_a, centroids_b)), repeats),
+        'are_boxes_overlapping_ns': _per_call_ns(are_boxes_overlapping, list(zip(boxes_a, boxes_b)), repeats),
+        'calculate_iou_ns': _per_call_ns(calculate_iou, list(zip(boxes_a, boxes_b)), repeats),
+        'convert_to_top_left_v1_ns': _per_call_ns(
+            convert_to_top_left_v1, [(x1 + 50, y1 + 40, 100, 80) for x1, y1, _, _ in boxes_a], repeats),
+    }
+    print(" utils: " + ", ".join(f"{name[:-3]} {ns:.0f} ns" for name, ns in results.items()))
+    return results
+
+
+def benchmark_database(num_rows=2000, direct_rows=200, repeats=5):
+    """Insert and query speed of Database on a scratch SQLite file.
+
+    insert_cow_events_data opens a connection per row, so it is timed on
+    direct_rows rows; the buffered writer and the queries see all num_rows.
+    """
+    event_types = ('Brushing', 'Drinking', 'Headbutt')
+    rows = [
+        (i % 40, event_types[i % 3], round(i * 0.1, 2), f"Event202401011200{i % 60:02d}001.mp4",
+         '20240101', f'1200{i % 60:02d}', '001', 1.0, None)
+        for i in range(num_rows)
+    ]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir, _working_directory(tmp_dir):
+        db = Database()
+        start = time.perf_counter()
+        for row in rows[:direct_rows]:
+            db.insert_cow_events_data(*row)
+        results['insert_rows_per_sec'] = direct_rows / (time.perf_counter() - start)
+
+        writer = db.buffered_event_writer()
+        start = time.perf_counter()
+        for row in rows:
+            writer.write(*row)
+        writer.close()
+        results['buffered_insert_rows_per_sec'] = num_rows / (time.perf_counter() - start)
+
+        for name, query in (('get_events_data', db.get_events_data), ('get_all_cow_events', db.get_all_cow_events)):
+            best = float('inf')
+            for _ in range(repeats):
+                start = time.perf_counter()
+                query()
+                best = min(best, time.perf_counter() - start)
+            results[f'{name}_ms'] = best * 1000
+
+        start = time.perf_counter()
+        db.delete_existing_events_for_video(rows[0][3])
+        results['delete_video_events_ms'] = (time.perf_counter() - start) * 1000
+        db.connection.close()
+    print(f" database: insert {results['insert_rows_per_sec']:.0f} rows/sec, "
+          f"buffered {results['buffered_insert_rows_per_sec']:.0f} rows/sec, "
+          f"get_all_cow_events {results['get_all_cow_events_ms']:.2f} ms over {num_rows + direct_rows} rows")
+    return results
+
+
+def benchmark_classifier_forward(batch_sizes=(1, 8, 32), repeats=5):
+    """Milliseconds per forward pass of the classifier network alone, on already preprocessed input"""
+    classifier = CowClassifier()  # random weights, only the timing matters
+    results = {}
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            batch = torch.randn(batch_size, 3, 224, 224)
+            classifier.logits(batch)  # warm-up
+            best = float('inf')
+            for _ in range(repeats):
+                start = time.perf_counter()
+                classifier.logits(batch)
+                best = min(best, time.perf_counter() - start)
+            results[f'batch_{batch_size}_ms'] = best * 1000
+            print(f" classifier forward, batch {batch_size:>3}: {best * 1000:8.2f} ms")
+    return results
+
+
+def benchmark_scripted_inference(num_frames=600, analytics_only=True, frame_size=(640, 360)):
+    """Stage times of a whole Inference run on a synthetic scene, with the detector replaced by its script.
+
+    Runs in a scratch directory, so the events go to a throwaway database. Also
+    reports whether the rules found every behaviour the scene acts out.
+    """
+    from synthetic_scene import ScriptedInference, scripted_scene, write_scene_video
+
+    script = scripted_scene(num_frames, frame_size)
+    with tempfile.TemporaryDirectory() as tmp_dir, _working_directory(tmp_dir):
+        video_path = write_scene_video(os.path.join(tmp_dir, "Event20240101120000001.mp4"), script, frame_size)
+        inf = ScriptedInference(video_path, script, os.path.join(tmp_dir, "scripted.mp4"),
+                                analytics_only=analytics_only, verbose=False)
+        inf.inference()
+    if inf.metrics is None:
+        raise RuntimeError("The scripted run did not finish (could not open the video)")
+
+    events = collections.Counter(event['event_type'] for event in inf.events)
+    result = {
+        'frames_per_sec': inf.throughput,
+        'stage_ms_per_frame': {stage: m['ms_per_frame'] for stage, m in inf.metrics['stages'].items()},
+        'counters': inf.metrics['counters'],
+        'events': dict(events),
+        'all_behaviours_detected': all(events[b] for b in ('Brushing', 'Drinking', 'Headbutt')),
+    }
+    mode = 'analytics only' if analytics_only else 'annotated'
+    print(f" scripted inference ({mode}): {inf.throughput:7.2f} frames/sec, events {result['events']}, "
+          f"rules {result['stage_ms_per_frame'].get('rules', 0):.3f} ms/frame")
+    return result
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+    }
+
+
+def run_suite(quick=False):
+    """Every offline benchmark, as {'environment': ..., 'results': {name: metrics}}.
+
+    A benchmark that fails (e.g. no ffmpeg for the annotated run) is recorded as
+    {'error': ...} and the others still run.
+    """
+    frames = 300 if quick else 600
+    crops = 64 if quick else 256
+    benchmarks = {
+        'utils': lambda: benchmark_utils(repeats=10 if quick else 50),
+        'geometry': lambda: {
+            f"cows{c}_heads{h}_brushes{b}_tubs{t}": {f'{name}_us': us for name, us in timings.items()}
+            for (c, h, b, t), timings in benchmark_geometry(repeats=100 if quick else 500).items()
+        },
+        'database': lambda: benchmark_database(num_rows=500 if quick else 2000),
+        'classifier_forward': benchmark_classifier_forward,
+        'classifier_batches': lambda: {
+            f'batch_{size}_crops_per_sec': rate for size, rate in benchmark_classifier_batches(num_crops=crops).items()
+        },
+        'preprocessing': lambda: benchmark_preprocessing(num_crops=crops),
+        'scripted_analytics_only': lambda: benchmark_scripted_inference(frames, analytics_only=True),
+        'scripted_annotated': lambda: benchmark_scripted_inference(frames, analytics_only=False),
+        'app_import': lambda: {'import_ms': check_import_budget(budget_seconds=float('inf')) * 1000},
+    }
+    results = {}
+    for name, benchmark in benchmarks.items():
+        try:
+            results[name] = benchmark()
+        except Exception as e:
+            print(f" {name} failed: {type(e).__name__}: {e}")
+            results[name] = {'error': f"{type(e).__name__}: {e}"}
+    return {'environment': environment_info(), 'results': results}
+
+
+def flatten_metrics(results, prefix=''):
+    """{'a.b.c': number} for every numeric leaf (flags and counts included, see metric_direction)"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def metric_direction(name):
+    """'higher' or 'lower' for the metrics that are better that way, None for the ones not compared"""
+    if name.endswith('per_sec'):
+        return 'higher'
+    if any(part.endswith(('_ms', '_us', '_ns', 'ms_per_frame')) for part in name.split('.')):
+        return 'lower'
+    return None
+
+
+def compare_results(baseline, current, tolerance=0.10):
+    """Metrics of current that are worse than baseline by more than tolerance (a fraction)"""
+    before = flatten_metrics(baseline['results'])
+    regressions = []
+    for name, value in flatten_metrics(current['results']).items():
+        direction = metric_direction(name)
+        old = before.get(name)
+        if direction is None or not old:
+            continue
+        change = value / old - 1
+        if (direction == 'higher' and change < -tolerance) or (direction == 'lower' and change > tolerance):
+            regressions.append({'metric': name, 'baseline': old, 'current': value, 'change': round(change, 3)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline CPU benchmark suite of the inference backend")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', metavar='BASELINE', help="results JSON of an earlier commit to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="allowed slowdown as a fraction, e.g. 0.1")
+    parser.add_argument('--quick', action='store_true', help="fewer frames, crops and repeats")
+    args = parser.parse_args(argv)
+
+    print(f" torch threads: {torch.get_num_threads()}")
+    suite = run_suite(quick=args.quick)
+    with open(args.output, 'w') as f:
+        json.dump(suite, f, indent=2)
+    print(f" Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, suite, args.tolerance)
+        for r in regressions:
+            print(f" regression {r['metric']}: {r['baseline']:.4g} -> {r['current']:.4g} ({r['change']:+.1%})")
+        print(f" {len(regressions)} regressions against {args.compare} (commit {baseline['environment'].get('commit')})")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
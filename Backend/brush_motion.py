@@ -0,0 +1,70 @@
+import math
+
+
+class BrushMotion:
+    """Fixed-size ring of the last centroid-to-centroid steps of one brush, with their running sum"""
+    __slots__ = ('steps', 'head', 'count', 'step_sum', 'last_centroid', 'last_seen_frame')
+
+    def __init__(self, capacity):
+        self.steps = [0.0] * capacity
+        self.head = 0
+        self.count = 0
+        self.step_sum = 0.0
+        self.last_centroid = None
+        self.last_seen_frame = None
+
+    def push(self, centroid, frame_idx):
+        self.last_seen_frame = frame_idx
+        if self.last_centroid is None:
+            self.last_centroid = centroid
+            return
+        step = math.sqrt((centroid[0] - self.last_centroid[0]) ** 2 + (centroid[1] - self.last_centroid[1]) ** 2)
+        self.last_centroid = centroid
+
+        capacity = len(self.steps)
+        if self.count == capacity:
+            self.step_sum -= self.steps[self.head]
+        else:
+            self.count += 1
+        self.steps[self.head] = step
+        self.step_sum += step
+        self.head = (self.head + 1) % capacity
+        if self.head == 0:
+            # Re-sum once per lap so float error from the running updates cannot build up
+            self.step_sum = sum(self.steps[:self.count])
+
+    def average_step(self):
+        return self.step_sum / self.count if self.count else 0.0
+
+
+class BrushMotionTracker:
+    """Brush movement over the last history_length centroids, used to filter brushing false positives.
+
+    A brush counts as moving when its average step between consecutive centroids
+    is above threshold. Each update and check is O(1). Brushes not seen for
+    max_age frames are evicted.
+    """
+
+    def __init__(self, history_length=10, threshold=2.0, max_age=300):
+        self.capacity = max(1, history_length - 1)
+        self.threshold = threshold
+        self.max_age = max_age
+        self.brushes = {}
+
+    def update(self, brush_id, centroid, frame_idx):
+        motion = self.brushes.get(brush_id)
+        if motion is None:
+            motion = self.brushes[brush_id] = BrushMotion(self.capacity)
+        motion.push(centroid, frame_idx)
+
+    def is_moving(self, brush_id):
+        motion = self.brushes.get(brush_id)
+        if motion is None or motion.count == 0:
+            return False
+        return motion.average_step() > self.threshold
+
+    def evict_stale(self, frame_idx):
+        stale = [brush_id for brush_id, motion in self.brushes.items() if frame_idx - motion.last_seen_frame > self.max_age]
+        for brush_id in stale:
+            del self.brushes[brush_id]
+        return len(stale)
@@ -0,0 +1,59 @@
+"""Batched YOLO detection followed by a standalone ByteTrack association step"""
+import numpy as np
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import IterableSimpleNamespace
+from ultralytics.utils.checks import check_yaml
+from detections import Detections, empty_detections
+
+try:
+    from ultralytics.utils import yaml_load
+except ImportError:  # newer Ultralytics releases
+    from ultralytics.utils import YAML
+    yaml_load = YAML.load
+
+
+class BatchedByteTracker:
+    """Runs model.predict on several frames in one forward pass, then ByteTrack on each frame in order.
+
+    This mirrors what model.track(persist=True) does for one frame: the same
+    tracker config, frame_rate=30 as Ultralytics uses, and a tracker update on
+    every frame, empty ones included, so lost tracks age out after track_buffer
+    frames. The track ids and boxes match the per-frame path, but the detector
+    can batch.
+    """
+
+    def __init__(self, model, tracker='bytetrack.yaml', conf=0.3, frame_rate=30):
+        if getattr(getattr(model, 'predictor', None), 'trackers', None):
+            # model.track() has run on it: its predictor keeps that run's tracker and callbacks, and any later
+            # track() call would share the model with this tracker. The registry hands out a separate instance.
+            raise ValueError("BatchedByteTracker needs a model that has not been used with track()")
+        self.model = model
+        self.conf = conf
+        self.cfg = IterableSimpleNamespace(**yaml_load(check_yaml(tracker)))
+        try:
+            self.tracker = BYTETracker(args=self.cfg, frame_rate=frame_rate)
+        except TypeError:  # Ultralytics 8.4+ dropped frame_rate; at 30 it left track_buffer unchanged anyway
+            self.tracker = BYTETracker(args=self.cfg)
+
+    def reset(self):
+        self.tracker.reset()
+
+    def track(self, frames):
+        """Detections (with track ids) for each frame, in order"""
+        if not frames:
+            return []
+        results = self.model.predict(list(frames), conf=self.conf, verbose=False)
+        detections = []
+        for result, frame in zip(results, frames):
+            # Rows of [x1, y1, x2, y2, track_id, score, cls, det_idx]
+            tracks = self.tracker.update(result.boxes.cpu().numpy(), frame)
+            if len(tracks) == 0:
+                detections.append(empty_detections())
+                continue
+            detections.append(Detections(
+                ids=tracks[:, 4].astype(int),
+                xyxys=tracks[:, :4].astype(int),
+                classes=tracks[:, 6].astype(int),
+                scores=tracks[:, 5].astype(np.float32)
+            ))
+        return detections
@@ -0,0 +1,232 @@
+"""Process one long video as time chunks in parallel worker processes and stitch the results.
+
+Each worker runs Inference (analytics only) on its chunk plus an overlap of the
+frames before it, so the tracker, brush motion and identity votes are warmed up
+when the chunk proper starts. Workers do not segment events themselves; they
+report which tracks were brushing or drinking on every frame. Track ids are
+matched across each boundary by box IoU over the overlap frames, and the
+per-frame activity of all chunks is then run through one EventSegmenter per
+behaviour, so events that cross a boundary are merged exactly as in a
+sequential run.
+
+    python Backend/chunked_inference.py static/input_video/Event20240626151811002.mp4 --chunks 4
+"""
+import argparse
+import concurrent.futures
+import functools
+import math
+import multiprocessing
+import os
+import cv2
+import numpy as np
+from batch_inference import init_worker
+from database import Database
+from event_segmenter import EventSegmenter
+from utils import calculate_iou, parse_video_name, write_headbutt_csv
+
+DEFAULT_OVERLAP_SECONDS = 10.0
+
+
+def plan_chunks(frame_count, chunks, overlap_frames):
+    """(warm_start, start, stop) per chunk; the last chunk reads to the end of the video (stop None)"""
+    bounds = np.linspace(0, frame_count, max(1, chunks) + 1).astype(int)
+    plan = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if stop > start:
+            plan.append((max(0, int(start) - overlap_frames), int(start), int(stop)))
+    if plan:
+        plan[-1] = plan[-1][:2] + (None,)
+    return plan
+
+
+def run_chunk(video_path, warm_start, start, stop, overlap_frames, inference_kwargs, inference_class=None):
+    """Worker: per-frame activity of frames [start, stop), plus the cow tracks needed to stitch ids"""
+    if inference_class is None:
+        from inference import Inference as inference_class
+
+    kwargs = dict(inference_kwargs, analytics_only=True, frame_range=(warm_start, stop))
+    inf = inference_class(video_path, **kwargs)
+    inf.store_events = False
+    inf.record_activity = True
+    inf.inference()
+    if not hasattr(inf, 'throughput'):
+        raise RuntimeError(f"Could not open video {video_path}")
+
+    end = inf.frame_idx if stop is None else stop
+    return {
+        'start': start,
+        'stop': end,
+        'fps': inf.fps,
+        'segmenter_params': {
+            'merge_gap_frames': inf.MERGE_THRESHOLD_FRAMES,
+            'finalize_gap_frames': inf.FINALIZE_EVENT_GAP_FRAMES,
+            'brushing_min_frames': inf.brushing_segmenter.min_frames,
+            'drinking_min_frames': inf.drinking_segmenter.min_frames,
+        },
+        'activity': {f: a for f, a in inf.activity.items() if start <= f < end},
+        # Overlap frames seen by both this chunk and its neighbour
+        'warmup_tracks': {f: t for f, t in inf.cow_tracks.items() if f < start},
+        'tail_tracks': {f: t for f, t in inf.cow_tracks.items() if f >= end - overlap_frames},
+        'headbutts': [h for h in inf.headbutt_log if start <= h['frame'] < end],
+        'throughput': inf.throughput,
+    }
+
+
+def match_tracks(previous_tracks, warmup_tracks, min_iou=0.5):
+    """Map track ids of the next chunk to ids of the previous one by mean box IoU over the shared frames"""
+    scores = {}
+    frames_seen = {}
+    for frame_idx, tracks in warmup_tracks.items():
+        previous = previous_tracks.get(frame_idx, {})
+        for tid, box in tracks.items():
+            frames_seen[tid] = frames_seen.get(tid, 0) + 1
+            for prev_tid, prev_box in previous.items():
+                iou = calculate_iou(box, prev_box)
+                if iou > 0:
+                    scores[(tid, prev_tid)] = scores.get((tid, prev_tid), 0.0) + iou
+
+    mapping = {}
+    used = set()
+    # Greedy on mean IoU, best pairs first
+    for (tid, prev_tid), total in sorted(scores.items(), key=lambda item: -item[1] / frames_seen[item[0][0]]):
+        if tid in mapping or prev_tid in used or total / frames_seen[tid] < min_iou:
+            continue
+        mapping[tid] = prev_tid
+        used.add(prev_tid)
+    return mapping
+
+
+def stitch_chunks(results, min_iou=0.5):
+    """Give every chunk's track ids one global numbering; returns one id mapping per chunk"""
+    mappings = []
+    next_id = 1
+    previous_tail = {}
+    for result in results:
+        matched = match_tracks(previous_tail, result['warmup_tracks'], min_iou) if mappings else {}
+        local_ids = set(matched)
+        for tracks in list(result['activity'].values()):
+            local_ids.update(tracks[0])
+            local_ids.update(tracks[1])
+        for tracks in list(result['warmup_tracks'].values()) + list(result['tail_tracks'].values()):
+            local_ids.update(tracks)
+        for headbutt in result['headbutts']:
+            local_ids.update(headbutt['tracks'])
+
+        mapping = dict(matched)
+        for tid in sorted(local_ids - set(matched)):
+            if not mappings:
+                mapping[tid] = tid  # the first chunk keeps its own ids, as in a sequential run
+            else:
+                mapping[tid] = next_id
+            next_id = max(next_id, mapping[tid] + 1)
+        mappings.append(mapping)
+        previous_tail = {f: {mapping[tid]: box for tid, box in tracks.items()} for f, tracks in result['tail_tracks'].items()}
+    return mappings
+
+
+def segment_events(results, mappings, fps):
+    """Run the stitched per-frame activity through one EventSegmenter per behaviour"""
+    params = results[0]['segmenter_params']
+    events = []
+
+    def on_event(event_type, cow_id, start_frame, end_frame):
+        duration = round((end_frame - start_frame + 1) / fps, 2)
+        events.append({'cow_id': str(int(cow_id)), 'event_type': event_type, 'event_value': duration,
+                       'start_frame': start_frame, 'end_frame': end_frame})
+
+    brushing = EventSegmenter(params['merge_gap_frames'], params['finalize_gap_frames'], params['brushing_min_frames'],
+                              functools.partial(on_event, 'Brushing'))
+    drinking = EventSegmenter(params['merge_gap_frames'], params['finalize_gap_frames'], params['drinking_min_frames'],
+                              functools.partial(on_event, 'Drinking'))
+    for result, mapping in zip(results, mappings):
+        for frame_idx in sorted(result['activity']):
+            brushing_ids, drinking_ids = result['activity'][frame_idx]
+            brushing.update(frame_idx, {mapping[tid] for tid in brushing_ids})
+            drinking.update(frame_idx, {mapping[tid] for tid in drinking_ids})
+    brushing.flush()
+    drinking.flush()
+
+    headbutt_log = []
+    logged_pairs = set()
+    for result, mapping in zip(results, mappings):
+        for headbutt in result['headbutts']:
+            # Same rule as the sequential run: only the first headbutt of each identity pair is kept
+            pair_key = tuple(sorted((headbutt['cow_1'], headbutt['cow_2'])))
+            if pair_key in logged_pairs:
+                continue
+            logged_pairs.add(pair_key)
+            idA, idB = (mapping[tid] for tid in headbutt['tracks'])
+            headbutt_log.append(headbutt)
+            events.append({'cow_id': f"{idA}-{idB}", 'event_type': 'Headbutt', 'event_value': headbutt['time'],
+                           'start_frame': headbutt['frame'], 'end_frame': headbutt['frame']})
+    return events, headbutt_log
+
+
+def run_chunked(video_path, chunks=4, workers=None, overlap_seconds=DEFAULT_OVERLAP_SECONDS, threads_per_worker=None,
+                store_events=True, headbutt_csv_path="headbutt_events.csv", inference_class=None, **inference_kwargs):
+    """Chunked equivalent of Inference(video_path, analytics_only=True).inference(); returns the stitched events.
+
+    overlap_seconds must be at least Inference.MERGE_EVENT_WITHIN_SECONDS, so every
+    boundary track is seen long enough by both chunks to be matched. inference_class
+    replaces Inference in the workers (e.g. synthetic_scene.ScriptedInference); it
+    has to be importable by name, as the workers are spawned.
+    """
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if not fps or frame_count <= 0:
+        raise RuntimeError(f"Could not read fps and frame count of {video_path}")
+
+    overlap_frames = int(math.ceil(overlap_seconds * fps))
+    plan = plan_chunks(frame_count, chunks, overlap_frames)
+    workers = max(1, min(workers or len(plan), len(plan)))
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    print(f" {video_path}: {frame_count} frames in {len(plan)} chunks, {overlap_frames} overlap frames, {workers} workers")
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=init_worker, initargs=(threads,)) as pool:
+        futures = [pool.submit(run_chunk, video_path, warm_start, start, stop, overlap_frames, inference_kwargs,
+                               inference_class)
+                   for warm_start, start, stop in plan]
+        results = [future.result() for future in futures]
+
+    merge_frames = results[0]['segmenter_params']['merge_gap_frames']
+    if overlap_frames < merge_frames:
+        print(f" Warning: overlap of {overlap_frames} frames is shorter than the {merge_frames} frame merge window")
+
+    mappings = stitch_chunks(results)
+    events, headbutt_log = segment_events(results, mappings, fps)
+
+    if store_events:
+        db = Database()
+        db.delete_existing_events_for_video(video_path)
+        date_str, time_str, cam_str = parse_video_name(os.path.basename(video_path))
+        writer = db.buffered_event_writer()
+        try:
+            for event in events:
+                headbutt = event['event_type'] == 'Headbutt'
+                writer.write(
+                    event['cow_id'], event['event_type'], event['event_value'],
+                    os.path.basename(video_path), date_str, time_str, cam_str,
+                    None if headbutt else event['event_value'], event['event_value'] if headbutt else None
+                )
+        finally:
+            writer.close()
+        write_headbutt_csv(headbutt_csv_path, headbutt_log)
+
+    print(f" Stitched {len(events)} events from {len(results)} chunks")
+    return events
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run analytics-only inference on one video in parallel chunks")
+    parser.add_argument('video_path')
+    parser.add_argument('--chunks', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--overlap-seconds', type=float, default=DEFAULT_OVERLAP_SECONDS)
+    parser.add_argument('--threads-per-worker', type=int, default=None)
+    parser.add_argument('--quiet', action='store_true', help="no per-frame logging from the detector and the rules")
+    args = parser.parse_args()
+    run_chunked(args.video_path, chunks=args.chunks, workers=args.workers, overlap_seconds=args.overlap_seconds,
+                threads_per_worker=args.threads_per_worker, verbose=not args.quiet)
@@ -1,6 +1,11 @@
+import threading
+import cv2
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from PIL import Image
+from torchvision.transforms import transforms
 
 class SENetBlock(nn.Module):
     def __init__(self, in_channels, reduction_ratio=16):
@@ -52,4 +57,150 @@ class CowIdentificationModel(nn.Module):
         x = self.global_avg_pool(x)
         x = x.view(x.size(0), -1)
         x = self.classifier(x)
-        return x
\ No newline at end of file
+        return x
+
+def cow_transform():
+    return transforms.Compose([
+        transforms.Resize((224, 224)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    ])
+
+
+def load_cow_model(weights_path=None, num_classes=117):
+    model = CowIdentificationModel(num_classes=num_classes)
+    if weights_path is not None:
+        model.load_state_dict(torch.load(weights_path, map_location="cpu"))
+    return model.eval()
+
+
+def export_classifier_onnx(weights_path, onnx_path, num_classes=117, opset=17):
+    """Export CowIdentificationModel to ONNX with a dynamic batch dimension"""
+    model = load_cow_model(weights_path, num_classes)
+    dummy = torch.zeros(1, 3, 224, 224)
+    torch.onnx.export(
+        model, dummy, onnx_path, input_names=['images'], output_names=['logits'],
+        dynamic_axes={'images': {0: 'batch'}, 'logits': {0: 'batch'}}, opset_version=opset
+    )
+    return onnx_path
+
+
+class CropPreprocessor:
+    """cow_transform() in NumPy/OpenCV: BGR crops to a normalized NCHW float batch.
+
+    Every crop is resized by cv2.resize straight into a preallocated uint8 batch
+    buffer. Shrinking uses INTER_AREA, which stands in for the antialiased bilinear
+    resize of PIL, and as in PIL the choice is made per axis. The channel flip,
+    the transpose and the normalization then happen in one vectorized pass into a
+    preallocated float32 buffer, which torch gets without a copy. The returned
+    tensor shares that buffer, so it is only valid until the next call.
+    """
+
+    def __init__(self, size=224, mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225), capacity=32):
+        self.size = size
+        # Folds ToTensor's /255 into the normalization: (x - 255 * mean) / (255 * std)
+        self.mean = (np.array(mean, dtype=np.float32) * 255)[:, None, None]
+        self.inv_std = (1 / (np.array(std, dtype=np.float32) * 255))[:, None, None]
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.pixels = np.empty((capacity, self.size, self.size, 3), dtype=np.uint8)
+        self.batch = np.empty((capacity, 3, self.size, self.size), dtype=np.float32)
+
+    def _resize(self, image, dst):
+        h, w = image.shape[:2]
+        size = self.size
+        if (h > size) != (w > size):
+            # One axis shrinks and the other grows: INTER_AREA for the shrinking axis only, as PIL filters per axis
+            image = cv2.resize(image, (size, h) if w > size else (w, size), interpolation=cv2.INTER_AREA)
+        interpolation = cv2.INTER_AREA if h > size and w > size else cv2.INTER_LINEAR
+        cv2.resize(image, (size, size), dst=dst, interpolation=interpolation)
+
+    def __call__(self, images):
+        n = len(images)
+        if n > len(self.pixels):
+            self._allocate(n)
+        pixels = self.pixels[:n]
+        for i, image in enumerate(images):
+            self._resize(image, pixels[i])
+        batch = self.batch[:n]
+        # BGR -> RGB and NHWC -> NCHW are views, so this is the only pass over the pixels
+        np.subtract(pixels[..., ::-1].transpose(0, 3, 1, 2), self.mean, out=batch)
+        batch *= self.inv_std
+        return torch.from_numpy(batch)
+
+
+class CowClassifier:
+    """Runs CowIdentificationModel on batches of BGR cow crops.
+
+    Crops go through CropPreprocessor; fast_preprocess=False uses the original
+    PIL/torchvision transform instead.
+    """
+
+    def __init__(self, weights_path=None, num_classes=117, batch_size=32, fast_preprocess=True):
+        self.model = load_cow_model(weights_path, num_classes)
+        self._setup(num_classes, batch_size, fast_preprocess)
+
+    def _setup(self, num_classes, batch_size, fast_preprocess=True):
+        self.num_classes = num_classes
+        self.batch_size = batch_size
+        self.transform = cow_transform()
+        self.fast_preprocess = fast_preprocess
+        self.preprocessor = CropPreprocessor(capacity=batch_size)
+        # The preprocessing buffers are reused, and the registry shares one classifier between jobs
+        self._lock = threading.Lock()
+
+    def preprocess_torchvision(self, images):
+        return torch.stack([self.transform(Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))) for image in images])
+
+    def preprocess(self, images):
+        if self.fast_preprocess:
+            return self.preprocessor(images)
+        return self.preprocess_torchvision(images)
+
+    def predict_proba(self, images):
+        """Softmax scores for every crop, one forward pass per batch_size crops"""
+        if len(images) == 0:
+            return np.empty((0, self.num_classes), dtype=np.float32)
+        probabilities = []
+        with self._lock, torch.no_grad():
+            for start in range(0, len(images), self.batch_size):
+                batch = self.preprocess(images[start:start + self.batch_size])
+                output = self.logits(batch)
+                probabilities.append(F.softmax(output, dim=1))
+        return torch.cat(probabilities).numpy()
+
+    def logits(self, batch):
+        return self.model(batch)
+
+    def predict(self, images):
+        return [int(i) for i in self.predict_proba(images).argmax(axis=1)]
+
+
+class OnnxCowClassifier(CowClassifier):
+    """CowClassifier that runs an exported ONNX model with ONNX Runtime on CPU"""
+
+    def __init__(self, onnx_path, num_classes=117, batch_size=32, num_threads=None):
+        import onnxruntime as ort  # optional, only needed for the onnx backend
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.model = None
+        self._setup(num_classes, batch_size)
+
+    def logits(self, batch):
+        return torch.from_numpy(self.session.run(None, {self.input_name: batch.numpy()})[0])
+
+
+class ScriptedCowClassifier(CowClassifier):
+    """CowClassifier for a TorchScript model file, e.g. the int8 variant written by quantize_classifier.py"""
+
+    def __init__(self, scripted_path, num_classes=117, batch_size=32):
+        if 'x86' in torch.backends.quantized.supported_engines:
+            torch.backends.quantized.engine = 'x86'
+        self.model = torch.jit.load(scripted_path, map_location="cpu").eval()
+        self._setup(num_classes, batch_size)
@@ -1,5 +1,8 @@
 import sqlite3
 import os
+import queue
+import threading
+import time
 from datetime import datetime
 
 
@@ -106,6 +109,7 @@ class Database:
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (CowID, EventType , EventValue, VideoName, VideoDate, VideoTime, Camera, EventDuration, EventTime))
         conn.commit()
+        conn.close()
 
 
     def insert_cow_occupancy_data(self, frame_number, cow_count, brush_busy, water_tub_busy, video_name):
@@ -235,6 +239,95 @@ class Database:
         self.cursor.execute("DELETE FROM VideoInformation")
         self.connection.commit()
 
+    def buffered_event_writer(self, flush_interval=5.0, max_batch=500):
+        """Return a BufferedEventWriter that stores CowEvents rows from a background thread"""
+        return BufferedEventWriter(self.database_name, flush_interval=flush_interval, max_batch=max_batch)
+
+
+class BufferedEventWriter:
+    """Collects CowEvents rows in memory and writes them from a background thread.
+
+    write() only puts the row on a queue, so the caller never waits on disk. The
+    writer thread keeps one connection open and inserts whatever has been queued
+    with executemany in a single transaction, every flush_interval seconds or as
+    soon as max_batch rows are waiting. close() writes the rest and stops the thread.
+    """
+
+    _STOP = object()
+
+    def __init__(self, database_name, flush_interval=5.0, max_batch=500):
+        self.database_name = database_name
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.rows_written = 0
+        self.transactions = 0
+        self.flush_durations = []  # seconds spent in each insert transaction
+        self.error = None
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, CowID, EventType, EventValue, VideoName, VideoDate, VideoTime, Camera, EventDuration, EventTime):
+        self._queue.put((CowID, EventType, EventValue, VideoName, VideoDate, VideoTime, Camera, EventDuration, EventTime))
+
+    def close(self):
+        self._queue.put(self._STOP)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _flush(self, conn, rows):
+        if not rows:
+            return
+        start = time.perf_counter()
+        with conn:
+            conn.executemany("""
+                INSERT INTO CowEvents (CowID, EventType , EventValue, VideoName, VideoDate, VideoTime, Camera, EventDuration, EventTime)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+        self.rows_written += len(rows)
+        self.transactions += 1
+        self.flush_durations.append(time.perf_counter() - start)
+
+    def _run(self):
+        # Batch workers in other processes write to the same file, so wait out their transactions
+        conn = sqlite3.connect(self.database_name, timeout=30)
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS CowEvents (
+                   CowID INTEGER, 
+                   EventType TEXT, 
+                   EventValue REAL, 
+                   VideoName TEXT, 
+                   VideoDate TEXT, 
+                   VideoTime TEXT, 
+                   Camera TEXT, 
+                   EventDuration REAL, 
+                   EventTime REAL
+                )
+            """)
+            conn.commit()
+            rows = []
+            deadline = time.monotonic() + self.flush_interval
+            stopping = False
+            while not stopping:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    if item is self._STOP:
+                        stopping = True
+                    else:
+                        rows.append(item)
+                except queue.Empty:
+                    pass
+                if stopping or len(rows) >= self.max_batch or time.monotonic() >= deadline:
+                    self._flush(conn, rows)
+                    rows = []
+                    deadline = time.monotonic() + self.flush_interval
+        except Exception as e:
+            self.error = e
+        finally:
+            conn.close()
+
 #     def create_cow_Images_table(self, database_name, table_name):
 #         self.conn = sqlite3.connect(database_name)
 #         self.cursor = self.conn.cursor()
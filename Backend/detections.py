@@ -0,0 +1,68 @@
+from collections import namedtuple
+import numpy as np
+
+# Tracker output for one frame: parallel arrays of track IDs, int xyxy boxes, class IDs and scores
+Detections = namedtuple('Detections', ['ids', 'xyxys', 'classes', 'scores'])
+
+
+def empty_detections():
+    return Detections(
+        ids=np.empty(0, dtype=int),
+        xyxys=np.empty((0, 4), dtype=int),
+        classes=np.empty(0, dtype=int),
+        scores=np.empty(0, dtype=np.float32)
+    )
+
+
+def interpolate_detections(start, end, t):
+    """Linearly interpolate the boxes of tracks present in both keyframes, 0 <= t <= 1.
+
+    Tracks seen in only one keyframe are kept from whichever keyframe is closer.
+    """
+    end_index = {int(tid): i for i, tid in enumerate(end.ids)}
+    ids, xyxys, classes, scores = [], [], [], []
+
+    for i, tid in enumerate(start.ids):
+        j = end_index.pop(int(tid), None)
+        if j is not None:
+            box = np.rint((1 - t) * start.xyxys[i] + t * end.xyxys[j]).astype(int)
+            ids.append(tid)
+            xyxys.append(box)
+            classes.append(start.classes[i] if t < 0.5 else end.classes[j])
+            scores.append((1 - t) * start.scores[i] + t * end.scores[j])
+        elif t < 0.5:
+            ids.append(tid)
+            xyxys.append(start.xyxys[i])
+            classes.append(start.classes[i])
+            scores.append(start.scores[i])
+
+    if t >= 0.5:
+        for j in end_index.values():
+            ids.append(end.ids[j])
+            xyxys.append(end.xyxys[j])
+            classes.append(end.classes[j])
+            scores.append(end.scores[j])
+
+    if not ids:
+        return empty_detections()
+    return Detections(
+        ids=np.array(ids, dtype=int),
+        xyxys=np.array(xyxys, dtype=int),
+        classes=np.array(classes, dtype=int),
+        scores=np.array(scores, dtype=np.float32)
+    )
+
+
+def offset_detections(detections, dx, dy):
+    """Shift boxes found in a cropped frame back into full-frame coordinates"""
+    if len(detections.ids) == 0 or (dx == 0 and dy == 0):
+        return detections
+    return detections._replace(xyxys=detections.xyxys + np.array([dx, dy, dx, dy], dtype=int))
+
+
+def scale_detections(detections, sx, sy):
+    """Map boxes from a resized frame back to the source resolution"""
+    if len(detections.ids) == 0 or (sx == 1 and sy == 1):
+        return detections
+    scale = np.array([sx, sy, sx, sy])
+    return detections._replace(xyxys=np.rint(detections.xyxys * scale).astype(int))
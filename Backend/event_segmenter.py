@@ -0,0 +1,59 @@
+class SegmentState:
+    __slots__ = ('start_frame', 'end_frame', 'active')
+
+    def __init__(self):
+        self.start_frame = None  # first frame of the merged event
+        self.end_frame = None  # last frame the behaviour was seen
+        self.active = False  # seen on the previous processed frame
+
+
+class EventSegmenter:
+    """Turns per-frame activity of a behaviour into merged events per track.
+
+    Each frame, update() gets the set of tracks showing the behaviour. A track
+    that restarts within merge_gap_frames continues its open event. An open event
+    with no activity for more than finalize_gap_frames is closed. Events shorter
+    than min_frames are dropped; the rest go to on_event(track_id, start_frame,
+    end_frame). Only tracks that are active or have an open event are visited.
+    """
+
+    def __init__(self, merge_gap_frames, finalize_gap_frames, min_frames, on_event):
+        self.merge_gap_frames = merge_gap_frames
+        self.finalize_gap_frames = finalize_gap_frames
+        self.min_frames = min_frames
+        self.on_event = on_event
+        self.states = {}  # only tracks with an open event
+
+    def _close(self, track_id, state):
+        if state.end_frame - state.start_frame + 1 >= self.min_frames:
+            self.on_event(track_id, state.start_frame, state.end_frame)
+
+    def update(self, frame_idx, active_ids):
+        for track_id in active_ids:
+            state = self.states.get(track_id)
+            if state is None:
+                state = self.states[track_id] = SegmentState()
+            if not state.active:
+                if state.start_frame is None:
+                    state.start_frame = frame_idx
+                elif frame_idx - state.end_frame - 1 > self.merge_gap_frames:
+                    # Gap too large, close the old event and start a new one
+                    self._close(track_id, state)
+                    state.start_frame = frame_idx
+            state.active = True
+            state.end_frame = frame_idx
+
+        for track_id, state in list(self.states.items()):
+            if track_id in active_ids:
+                continue
+            state.active = False
+            if frame_idx - state.end_frame - 1 > self.finalize_gap_frames:
+                self._close(track_id, state)
+                # A closed track behaves exactly like one never seen, so its state can go
+                del self.states[track_id]
+
+    def flush(self):
+        """Close every open event, at the end of the video"""
+        for track_id, state in self.states.items():
+            self._close(track_id, state)
+        self.states.clear()
@@ -0,0 +1,40 @@
+"""Export the detector and the cow classifier to the artifacts of a runtime backend.
+
+    python Backend/export_models.py --backend onnx
+
+The onnx backend needs onnx and onnxscript (torch's ONNX exporter) to export and
+onnxruntime to run; all three are in requirements.txt.
+"""
+import argparse
+import os
+import shutil
+from ultralytics import YOLO
+from classificationmodel import export_classifier_onnx
+from model_registry import ARTIFACTS
+
+
+def export_onnx(imgsz=640, opset=17):
+    source = ARTIFACTS['torch']
+    target = ARTIFACTS['onnx']
+
+    # Static input size: Ultralytics letterboxes every frame to imgsz before the session runs
+    exported = YOLO(source['detector']).export(format='onnx', imgsz=imgsz, opset=opset, dynamic=False)
+    if os.path.abspath(exported) != os.path.abspath(target['detector']):
+        shutil.move(exported, target['detector'])
+    print(f" Detector exported to {target['detector']}")
+
+    export_classifier_onnx(source['classifier'], target['classifier'], opset=opset)
+    print(f" Classifier exported to {target['classifier']}")
+    return target
+
+
+EXPORTERS = {'onnx': export_onnx}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the models for a runtime backend")
+    parser.add_argument('--backend', choices=sorted(EXPORTERS), default='onnx')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--opset', type=int, default=17)
+    args = parser.parse_args()
+    EXPORTERS[args.backend](imgsz=args.imgsz, opset=args.opset)
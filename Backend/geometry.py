@@ -0,0 +1,98 @@
+"""Vectorized versions of the box helpers in utils.py, computed for all box pairs of a frame at once"""
+import numpy as np
+
+
+def centroids(xyxys):
+    xyxys = np.asarray(xyxys, dtype=np.float64).reshape(-1, 4)
+    return np.stack(((xyxys[:, 0] + xyxys[:, 2]) / 2, (xyxys[:, 1] + xyxys[:, 3]) / 2), axis=1)
+
+
+def pairwise_centroid_distances(boxes1, boxes2):
+    c1 = centroids(boxes1)
+    c2 = centroids(boxes2)
+    return np.sqrt(((c1[:, None, :] - c2[None, :, :]) ** 2).sum(axis=2))
+
+
+def pairwise_overlap_areas(boxes1, boxes2):
+    """Intersection area of every pair, 0 where the boxes only touch or are apart (as are_boxes_overlapping)"""
+    b1 = np.asarray(boxes1, dtype=np.int64).reshape(-1, 4)
+    b2 = np.asarray(boxes2, dtype=np.int64).reshape(-1, 4)
+    x_overlap = np.minimum(b1[:, None, 2], b2[None, :, 2]) - np.maximum(b1[:, None, 0], b2[None, :, 0])
+    y_overlap = np.minimum(b1[:, None, 3], b2[None, :, 3]) - np.maximum(b1[:, None, 1], b2[None, :, 1])
+    return np.clip(x_overlap, 0, None) * np.clip(y_overlap, 0, None)
+
+
+def pairwise_containment(small_boxes, big_boxes):
+    """[i, j] is True when small_boxes[i] lies inside big_boxes[j] (as Inference.is_inside)"""
+    s = np.asarray(small_boxes).reshape(-1, 4)
+    b = np.asarray(big_boxes).reshape(-1, 4)
+    return ((s[:, None, 0] >= b[None, :, 0]) & (s[:, None, 1] >= b[None, :, 1]) &
+            (s[:, None, 2] <= b[None, :, 2]) & (s[:, None, 3] <= b[None, :, 3]))
+
+
+class FrameGeometry:
+    """Centroid-distance, overlap-area and containment matrices over all boxes of one frame.
+
+    Rows and columns follow the order of the xyxys array, so callers select the
+    block they need with index arrays, e.g. geometry.distances(cow_idx, brush_idx).
+    """
+
+    def __init__(self, xyxys):
+        self.xyxys = np.asarray(xyxys).reshape(-1, 4)
+        self.centroids = centroids(self.xyxys)
+        self.distance_matrix = pairwise_centroid_distances(self.xyxys, self.xyxys)
+        self.overlap_matrix = pairwise_overlap_areas(self.xyxys, self.xyxys)
+        self.containment_matrix = pairwise_containment(self.xyxys, self.xyxys)
+
+    @staticmethod
+    def _block(matrix, rows, cols):
+        return matrix[np.ix_(np.asarray(rows, dtype=int), np.asarray(cols, dtype=int))]
+
+    def distances(self, rows, cols):
+        return self._block(self.distance_matrix, rows, cols)
+
+    def overlaps(self, rows, cols):
+        return self._block(self.overlap_matrix, rows, cols)
+
+    def containment(self, rows, cols):
+        return self._block(self.containment_matrix, rows, cols)
+
+    def first_inside(self, small_idx, big_idx):
+        """For each big box, the index (into small_idx) of the first small box inside it, or -1"""
+        small_idx = np.asarray(small_idx, dtype=int)
+        big_idx = np.asarray(big_idx, dtype=int)
+        if len(small_idx) == 0 or len(big_idx) == 0:
+            return np.full(len(big_idx), -1, dtype=int)
+        inside = self.containment(small_idx, big_idx)
+        first = inside.argmax(axis=0)
+        return np.where(inside.any(axis=0), first, -1)
+
+
+def head_body_candidate_pairs(body_boxes, head_points, margin):
+    """Pairs (i, j), i < j, where one cow's head can be within margin of the other's body.
+
+    Each cow is reduced to the x-interval spanning its body and head, widened by
+    margin; a sort-and-sweep over those intervals keeps only overlapping pairs,
+    which are then checked the same way on y. Any pair for which
+    is_point_near_body(head, body, buffer=margin) can hold in either direction
+    survives, so the pruning never drops a real headbutt.
+    """
+    boxes = np.asarray(body_boxes, dtype=np.int64).reshape(-1, 4)
+    heads = np.asarray(head_points, dtype=np.int64).reshape(-1, 2)
+    if len(boxes) < 2:
+        return []
+    x_lo = np.minimum(boxes[:, 0], heads[:, 0]) - margin
+    x_hi = np.maximum(boxes[:, 2], heads[:, 0]) + margin
+    y_lo = np.minimum(boxes[:, 1], heads[:, 1]) - margin
+    y_hi = np.maximum(boxes[:, 3], heads[:, 1]) + margin
+
+    pairs = []
+    active = []
+    for k in np.argsort(x_lo, kind='stable'):
+        active = [a for a in active if x_hi[a] >= x_lo[k]]
+        for a in active:
+            if y_lo[a] <= y_hi[k] and y_lo[k] <= y_hi[a]:
+                pairs.append((min(a, k), max(a, k)))
+        active.append(k)
+    pairs.sort()
+    return [(int(i), int(j)) for i, j in pairs]
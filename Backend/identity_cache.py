@@ -0,0 +1,93 @@
+import numpy as np
+from utils import calculate_iou
+
+
+class TrackIdentity:
+    __slots__ = ('vote_sum', 'vote_count', 'cnn_id', 'frozen', 'frozen_frame', 'last_box')
+
+    def __init__(self):
+        self.vote_sum = None
+        self.vote_count = 0
+        self.cnn_id = None
+        self.frozen = False
+        self.frozen_frame = None
+        self.last_box = None
+
+    def reset_votes(self):
+        self.vote_sum = None
+        self.vote_count = 0
+        self.frozen = False
+        self.frozen_frame = None
+
+
+class TrackIdentityCache:
+    """Keeps one classifier identity per tracker ID instead of reclassifying every frame.
+
+    Softmax scores are summed per track until the mean confidence reaches
+    confidence_threshold (after at least min_votes) or max_votes have been
+    collected, then the ID is frozen. A frozen ID is dropped again when the
+    track's box jumps (IoU with the previous box below box_change_iou) or
+    after refresh_interval frames.
+    """
+
+    def __init__(self, confidence_threshold=0.8, min_votes=3, max_votes=15, refresh_interval=300, box_change_iou=0.3):
+        self.confidence_threshold = confidence_threshold
+        self.min_votes = min_votes
+        self.max_votes = max_votes
+        self.refresh_interval = refresh_interval
+        self.box_change_iou = box_change_iou
+        self.tracks = {}
+        self.lookups = 0
+        self.hits = 0
+        self.classifier_calls = 0
+
+    def lookup(self, tid, bbox, frame_idx):
+        """Return True if the track has a frozen ID that is still valid, False if it needs classifying"""
+        self.lookups += 1
+        track = self.tracks.setdefault(tid, TrackIdentity())
+        box_jumped = track.last_box is not None and calculate_iou(track.last_box, bbox) < self.box_change_iou
+        track.last_box = tuple(int(v) for v in bbox)
+
+        if track.frozen:
+            expired = self.refresh_interval is not None and frame_idx - track.frozen_frame >= self.refresh_interval
+            if not box_jumped and not expired:
+                self.hits += 1
+                return True
+            track.reset_votes()
+        elif box_jumped:
+            track.reset_votes()
+        return False
+
+    def add_vote(self, tid, probabilities, frame_idx):
+        self.classifier_calls += 1
+        track = self.tracks.setdefault(tid, TrackIdentity())
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        track.vote_sum = probabilities.copy() if track.vote_sum is None else track.vote_sum + probabilities
+        track.vote_count += 1
+
+        mean_votes = track.vote_sum / track.vote_count
+        track.cnn_id = int(mean_votes.argmax())
+        confident = track.vote_count >= self.min_votes and mean_votes[track.cnn_id] >= self.confidence_threshold
+        if confident or track.vote_count >= self.max_votes:
+            track.frozen = True
+            track.frozen_frame = frame_idx
+        return track.cnn_id
+
+    def get(self, tid, default=None):
+        track = self.tracks.get(tid)
+        if track is None or track.cnn_id is None:
+            return default
+        return track.cnn_id
+
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def stats(self):
+        return {
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': round(self.hit_rate(), 4),
+            'classifier_calls': self.classifier_calls,
+            'classifier_calls_saved': self.hits,
+            'frozen_tracks': sum(1 for track in self.tracks.values() if track.frozen),
+        }
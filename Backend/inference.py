@@ -1,19 +1,27 @@
 """copy of inference for final submission for fixing bugs"""
 import os
 import cv2
+import json
 import time
-import csv
 import numpy as np
-import random
-from PIL import Image
-from ultralytics import YOLO
-from classificationmodel import CowIdentificationModel
-from deep_sort_realtime.deepsort_tracker import DeepSort
-from torchvision.transforms import transforms
-from utils import convert_to_top_left_v1, calculate_centroid, calculate_centroid_distance, are_boxes_overlapping
+from model_registry import MODELS, artifact_paths
+from resource_governor import RSSMonitor
+from metrics import METRICS, StageTimer
+from utils import calculate_centroid, parse_video_name, write_headbutt_csv
 from database import Database
-import torch
-import subprocess
+from identity_cache import TrackIdentityCache
+from detections import Detections, empty_detections, interpolate_detections, offset_detections, scale_detections
+from roi import CAMERA_ROI_PATH, load_camera_rois
+from geometry import FrameGeometry, head_body_candidate_pairs
+from motion_gate import MotionGate
+from byte_tracking import BatchedByteTracker
+from brush_motion import BrushMotionTracker
+from event_segmenter import EventSegmenter
+from video_io import FFmpegFrameReader, FFmpegVideoWriter
+import queue
+import threading
+import math
+import functools
 
 root_dir = 'static'
 temp_folder = 'temp'
@@ -30,7 +38,10 @@ class Inference:
         x1b, y1b, x2b, y2b = big_box
         return x1s >= x1b and y1s >= y1b and x2s <= x2b and y2s <= y2b
 
-    def __init__(self, video_path, output_path=None, model_path='Backend/models/yolov8/last_trained_best.pt'):
+    def __init__(self, video_path, output_path=None, model_path=None, pipelined=True,
+                 detection_stride=1, motion_threshold=None, camera_rois=None, analytics_only=False,
+                 output_preset='veryfast', output_crf=23, frame_reader='opencv', decode_width=None, decode_threads=0,
+                 frame_range=None, backend='torch', detection_batch_size=1, verbose=True, models=None):
         self.video_path = video_path
         filename = os.path.basename(video_path)
 
@@ -43,41 +54,113 @@ class Inference:
         self.output_path = output_path
         print(" Using input video:", self.video_path)
         print(" Saving annotated video to:", self.output_path)
-        self.model = YOLO(model_path)
-        self.tracker = DeepSort(max_age=30)
+        # Models come from the process-wide registry, so they are only loaded for the first video
+        # (models= swaps in another registry, e.g. the scripted one of the benchmarks).
+        # backend picks the runtime and its artifacts: 'torch' (.pt/.pth), 'onnx' (ONNX Runtime on CPU)
+        # or 'int8' (quantized classifier)
+        self.backend = backend
+        self.model_paths = dict(artifact_paths(backend))
+        if model_path is not None:
+            self.model_paths['detector'] = model_path
+        self.models = models if models is not None else MODELS
+        # Batched detection runs plain predict() on its own instance, never one that model.track() has touched
+        detector_mode = 'predict' if int(detection_batch_size) > 1 else 'track'
+        self.model = self.models.detector(self.model_paths['detector'], mode=detector_mode)
         self.db = Database()
         self.fps = 30
         self.logged_brushing = set()
         self.logged_drinking = set()
         self.logged_headbutts = set()
 
+        # Analytics-only runs skip drawing and the annotated video
+        self.annotate = not analytics_only
+
+        # The annotated video is encoded once, straight to browser-ready H.264, by an ffmpeg pipe
+        self.OUTPUT_PRESET = output_preset
+        self.OUTPUT_CRF = output_crf
+
+        # Frame source: 'opencv' (cv2.VideoCapture) or 'ffmpeg' (multithreaded decode, optional resize in the decoder).
+        # DECODE_WIDTH only applies without annotation; the annotated video is always drawn at the source resolution.
+        self.FRAME_READER = frame_reader
+        self.DECODE_WIDTH = decode_width
+        self.DECODE_THREADS = decode_threads
+        self.frame_scale = (1.0, 1.0)  # decoded size / source size
+
+        # Process only frames [start, stop) of the video (stop None reads to the end); frame indices stay absolute
+        self.FRAME_RANGE = frame_range
+        self.start_frame = 0
+        # Chunk workers turn these off and on: they keep events in memory and report per-frame activity instead
+        self.store_events = True
+        self.record_activity = False
+        self.activity = {}  # frame_idx -> (brushing track ids, drinking track ids)
+        self.cow_tracks = {}  # frame_idx -> {track id: cow box}
+
+        # Decode and encode run in their own threads; queues bound how far they may run ahead
+        self.pipelined = pipelined
+        self.PIPELINE_QUEUE_SIZE = 8
+
+        # Run the tracker on every DETECTION_STRIDE-th frame and interpolate the boxes in between
+        self.DETECTION_STRIDE = max(1, int(detection_stride))
+
+        # Above 1, keyframes are detected DETECTION_BATCH_SIZE at a time with model.predict and associated
+        # by a standalone ByteTrack instead of model.track(persist=True) one frame at a time
+        self.DETECTION_BATCH_SIZE = max(1, int(detection_batch_size))
+        self.batched_tracker = None
+
+        # Motion gate: reuse the previous detections while the scene is static (None disables it)
+        self.MOTION_GATE_THRESHOLD = motion_threshold
+        self.MOTION_GATE_REFRESH_SECONDS = 2.0
+        self.MOTION_GATE_WIDTH = 160
+        self.motion_gate = None
+
+        # Per-camera regions of interest (cam_str -> CameraROI); the detector only sees that part of the frame
+        self.CAMERA_ROI_PATH = CAMERA_ROI_PATH
+        self.camera_rois = camera_rois if camera_rois is not None else load_camera_rois(self.CAMERA_ROI_PATH)
+        self.roi = None
+        self.events = []
+        self.event_writer = None
+
         if not output_path.endswith('.mp4'):
             output_path += '.mp4'
         self.output_path = output_path
-        print(" Saving annotated video to:", self.output_path)
+        self.browser_output_path = output_path.replace('.mp4', '_fixed.mp4')
+        print(" Saving annotated video to:", self.browser_output_path)
+
+        # Per-stage timers and counters; the report of each video is written next to its output
+        self.timer = StageTimer()
+        self.metrics = None
+        self.metrics_path = os.path.splitext(output_path)[0] + '_metrics.json'
+        # verbose=False silences the per-frame logging (Ultralytics and the rules), keeping the per-video summary
+        self.verbose = verbose
         
         # Brush motion tracking for filtering false positives
-        self.brush_motion_history = {}
         self.MOTION_HISTORY_LENGTH = 10
         self.MOTION_THRESHOLD = 2.0
+        self.BRUSH_HISTORY_MAX_AGE_SECONDS = 10.0  # Forget brushes that have not been seen for this long
+        self.brush_motion = BrushMotionTracker(self.MOTION_HISTORY_LENGTH, self.MOTION_THRESHOLD)
 
 
 
 
-        self.classifier = CowIdentificationModel()
-        self.classifier.load_state_dict(torch.load("Backend/models/classifier/best_model.pth", map_location="cpu"))
-        self.classifier.eval()
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
+        # All cow crops of a frame are classified together, CLASSIFY_BATCH_SIZE crops per forward pass
+        self.CLASSIFY_BATCH_SIZE = 32
+        self.classifier = self.models.classifier(self.model_paths['classifier'], batch_size=self.CLASSIFY_BATCH_SIZE)
         self.track_to_cnn_id = {}
 
+        # Identity cache: vote per track until confident, then only reclassify on box jumps or refresh
+        self.IDENTITY_CONFIDENCE_THRESHOLD = 0.8
+        self.IDENTITY_MIN_VOTES = 3
+        self.IDENTITY_MAX_VOTES = 15
+        self.IDENTITY_REFRESH_SECONDS = 10.0
+        self.IDENTITY_BOX_CHANGE_IOU = 0.3
+        self.identity_cache = None
+
         # Updated thresholds based on latest calibration
         self.BRUSHING_DISTANCE_THRESHOLD = 80  # More accurate detection
         self.OVERLAP_THRESHOLD = 0.02  # Reduced from 0.05
-        self.DRINKING_MIN_FRAMES = 30  # More sensitive detection
+        self.BRUSHING_MIN_SECONDS = 1.0
+        self.DRINKING_MIN_SECONDS = 1.0  # More sensitive detection, converted to DRINKING_MIN_FRAMES per video
+        self.DRINKING_MIN_FRAMES = 30
         self.DRINKING_OVERLAP_THRESHOLD_HEAD = 0.05
         self.DRINKING_OVERLAP_THRESHOLD_COW = 0.03
         self.HEAD_DISTANCE = 10
@@ -89,473 +172,699 @@ class Inference:
         self.FINALIZE_EVENT_AFTER_SECONDS = 5.0  # Log event if no activity for 5 secs
 
         self.headbutt_log = []
-        # New event state tracking with merging support
-        self.brushing_states = {}  # Will store: merged_event_start_frame, last_active_segment_end_frame, is_active_in_previous_frame
-        self.drinking_states = {}  # Same structure as brushing_states
+        self.headbutt_csv_path = "headbutt_events.csv"
+        # Event state tracking with merging support, built per video once fps is known
+        self.brushing_segmenter = None
+        self.drinking_segmenter = None
 
     def is_brush_moving(self, brush_id):
         """Check if brush is actually moving to filter false positives"""
-        history = self.brush_motion_history.get(brush_id, [])
-        if len(history) < 2:
-            return False
-        total_dist = sum(calculate_centroid_distance(history[i-1], history[i]) for i in range(1, len(history)))
-        if len(history) > 1:
-            avg_dist = total_dist / (len(history) - 1)
-            return avg_dist > self.MOTION_THRESHOLD
-        return False
+        return self.brush_motion.is_moving(brush_id)
     
     def predict_cow_id(self, image):
-        image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-        image_tensor = self.transform(image).unsqueeze(0)
-        with torch.no_grad():
-            output = self.classifier(image_tensor)
-            probabilities = torch.nn.functional.softmax(output, dim=1)
-            _, predicted = torch.max(probabilities, 1)
-        return int(predicted.item())
+        return self.predict_cow_ids([image])[0]
+
+    def predict_cow_ids(self, images):
+        """Classify a list of BGR cow crops in batched forward passes"""
+        return self.classifier.predict(images)
+
+    def predict_cow_probabilities(self, images):
+        return self.classifier.predict_proba(images)
 
     def inference(self):
-        self.db.delete_existing_events_for_video(self.video_path)
+        # The detector is shared: hold it for the whole video and start from a fresh tracker
+        with self.models.detector_session(self.model), RSSMonitor() as rss:
+            result = self._run_inference()
+        self.peak_rss_mb = rss.peak_mb
+        self.rss_increase_mb = rss.increase_mb
+        print(f" Peak RSS: {self.peak_rss_mb:.0f} MB ({self.rss_increase_mb:+.0f} MB during this video)")
+        return result
+
+    def _run_inference(self):
+        self.timer = StageTimer()
+        if self.store_events:
+            with self.timer.time('db'):
+                self.db.delete_existing_events_for_video(self.video_path)
         print(" Starting inference...")
-        cap = cv2.VideoCapture(self.video_path)
+        cap = self.open_capture()
         if not cap.isOpened():
             print(f" Failed to open video: {self.video_path}")
             return
         
-        filename = os.path.basename(self.video_path)
-        date_str = filename[5:13]
-        time_str = filename[13:19]
-        cam_str = filename[19:22] if len(filename) >= 22 else '000'
+        self.filename = os.path.basename(self.video_path)
+        self.date_str, self.time_str, self.cam_str = parse_video_name(self.filename)
         self.fps = cap.get(cv2.CAP_PROP_FPS)
+        self.roi = self.camera_rois.get(self.cam_str)
+        if self.roi is not None:
+            print(f" Using region of interest {self.roi.rect} for camera {self.cam_str}")
         frame_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         frame_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         print(f" Frame width: {frame_w}, height: {frame_h}")
+        source_w, source_h = getattr(cap, 'source_size', (frame_w, frame_h))
+        self.frame_scale = (frame_w / source_w, frame_h / source_h)
+        if self.frame_scale != (1.0, 1.0):
+            # Detection runs on the decoded frames; boxes are mapped back so the rules keep source-pixel thresholds
+            print(f" Decoding at {frame_w}x{frame_h} (source {source_w}x{source_h})")
+            if self.roi is not None:
+                self.roi = self.roi.scaled(*self.frame_scale)
         print(f" FPS: {self.fps}")
-        print(f" Output path: {self.output_path}")
-
-        out_vid = cv2.VideoWriter(self.output_path, fourcc, self.fps, (frame_w, frame_h))
-
-        if not out_vid.isOpened():
-            print(f"Failed to open VideoWriter for path: {self.output_path}")
-            return
+        print(f" Output path: {self.browser_output_path}")
+
+        out_vid = None
+        if self.annotate:
+            out_vid = FFmpegVideoWriter(self.browser_output_path, self.fps, (frame_w, frame_h),
+                                        preset=self.OUTPUT_PRESET, crf=self.OUTPUT_CRF)
+
+            if not out_vid.isOpened():
+                # Not a silent return: the caller would report a video that was never written
+                cap.release()
+                raise RuntimeError(f"Failed to open VideoWriter for path: {self.browser_output_path} (is ffmpeg installed?)")
+            else:
+                print(f"VideoWriter initialized. Output will be saved to: {self.browser_output_path}")
         else:
-            print(f"VideoWriter initialized. Output will be saved to: {self.output_path}")
+            print(" Analytics-only mode: no annotated video will be written")
 
 
 
-        old_head_positions = {}
-        recent_hits = {}
-        frame_idx = 0
-        frame_count = 0
+        self.old_head_positions = {}
+        self.start_frame = self.FRAME_RANGE[0] if self.FRAME_RANGE else 0
+        self.frame_idx = self.start_frame
+        self.frame_count = 0
+        self.activity = {}
+        self.cow_tracks = {}
         
         # Calculate frame thresholds for event merging
-        MERGE_THRESHOLD_FRAMES = int(self.MERGE_EVENT_WITHIN_SECONDS * self.fps)
-        FINALIZE_EVENT_GAP_FRAMES = int(self.FINALIZE_EVENT_AFTER_SECONDS * self.fps)
-        
-        while cap.isOpened():
-            ret, frame = cap.read()
+        self.MERGE_THRESHOLD_FRAMES = int(self.MERGE_EVENT_WITHIN_SECONDS * self.fps)
+        self.FINALIZE_EVENT_GAP_FRAMES = int(self.FINALIZE_EVENT_AFTER_SECONDS * self.fps)
+        self.DRINKING_MIN_FRAMES = int(round(self.DRINKING_MIN_SECONDS * self.fps))
+        self.brushing_segmenter = EventSegmenter(
+            self.MERGE_THRESHOLD_FRAMES, self.FINALIZE_EVENT_GAP_FRAMES, math.ceil(self.BRUSHING_MIN_SECONDS * self.fps),
+            functools.partial(self.log_segment, 'Brushing', self.logged_brushing)
+        )
+        self.drinking_segmenter = EventSegmenter(
+            self.MERGE_THRESHOLD_FRAMES, self.FINALIZE_EVENT_GAP_FRAMES, self.DRINKING_MIN_FRAMES,
+            functools.partial(self.log_segment, 'Drinking', self.logged_drinking)
+        )
+        self.brush_motion = BrushMotionTracker(
+            self.MOTION_HISTORY_LENGTH, self.MOTION_THRESHOLD,
+            max_age=int(self.BRUSH_HISTORY_MAX_AGE_SECONDS * self.fps)
+        )
+
+        self.identity_cache = TrackIdentityCache(
+            confidence_threshold=self.IDENTITY_CONFIDENCE_THRESHOLD,
+            min_votes=self.IDENTITY_MIN_VOTES,
+            max_votes=self.IDENTITY_MAX_VOTES,
+            refresh_interval=int(self.IDENTITY_REFRESH_SECONDS * self.fps),
+            box_change_iou=self.IDENTITY_BOX_CHANGE_IOU
+        )
+
+        self.events = []
+        self.detection_calls = 0
+        self.motion_gate = None
+        if self.DETECTION_BATCH_SIZE > 1:
+            self.batched_tracker = BatchedByteTracker(self.model)
+            self.batched_tracker.reset()  # track ids start from 1, as with a fresh model.track
+        if self.MOTION_GATE_THRESHOLD is not None:
+            self.motion_gate = MotionGate(
+                threshold=self.MOTION_GATE_THRESHOLD,
+                refresh_interval=max(1, int(self.MOTION_GATE_REFRESH_SECONDS * self.fps / self.DETECTION_STRIDE)),
+                width=self.MOTION_GATE_WIDTH
+            )
+
+        # Events are queued here and written to the database in batches by a background thread
+        self.event_writer = self.db.buffered_event_writer()
+        start_time = time.time()
+        try:
+            if self.pipelined:
+                self.run_pipeline(cap, out_vid)
+            else:
+                for frame in self.process_frames(self.read_frames(cap)):
+                    if out_vid is not None:
+                        with self.timer.time('encode'):
+                            out_vid.write(frame)
+            self.finalize_events()
+        finally:
+            self.event_writer.close()
+            for seconds in self.event_writer.flush_durations:
+                self.timer.add('db', seconds)
+            self.event_writer = None
+            cap.release()
+            if out_vid is not None:
+                # Waits for ffmpeg to finish the browser-ready mp4
+                with self.timer.time('encode_finalize'):
+                    out_vid.release()
+        elapsed = time.time() - start_time
+
+        print(f"Opened video: {self.video_path}")
+        print(f" Inference completed. Total frames processed: {self.frame_count}")
+        self.throughput = (self.frame_idx - self.start_frame) / elapsed if elapsed > 0 else 0
+        print(f" Throughput: {self.throughput:.2f} frames/sec, tracker calls: {self.detection_calls} (stride {self.DETECTION_STRIDE})")
+        identity_stats = self.identity_cache.stats()
+        print(f" Identity cache hit rate: {identity_stats['hit_rate']:.1%}, "
+              f"classifier calls: {identity_stats['classifier_calls']}, saved: {identity_stats['classifier_calls_saved']}")
+        if self.motion_gate is not None:
+            print(f" Motion gate skipped {self.motion_gate.skip_fraction():.1%} of {self.motion_gate.checked} keyframes")
+
+        if self.store_events:
+            write_headbutt_csv(self.headbutt_csv_path, self.headbutt_log)
+        self.report_metrics(elapsed, identity_stats)
+    
+
+
+        if self.annotate:
+            print(" Inference complete, video annotated, and headbutts saved to CSV and DB.")
+        else:
+            print(" Inference complete, events and headbutts saved to CSV and DB.")
+
+    def report_metrics(self, elapsed, identity_stats):
+        """Build the per-video metrics report, add it to the process-wide METRICS and write it next to the output"""
+        frames = self.frame_idx - self.start_frame
+        self.timer.count('detector_calls', self.detection_calls)
+        self.timer.count('classifier_calls_saved', identity_stats['classifier_calls_saved'])
+        self.metrics = dict(
+            video=self.video_path,
+            frames=frames,
+            elapsed_seconds=round(elapsed, 3),
+            throughput_fps=round(self.throughput, 2),
+            **self.timer.report(frames)
+        )
+        METRICS.record_video(self.timer, elapsed)
+        if self.store_events:
+            os.makedirs(os.path.dirname(self.metrics_path) or '.', exist_ok=True)
+            with open(self.metrics_path, 'w') as f:
+                json.dump(self.metrics, f, indent=2)
+        slowest = sorted(self.metrics['stages'].items(), key=lambda item: -item[1]['seconds'])
+        print(" Stage times: " + ", ".join(f"{stage} {m['seconds']:.2f}s" for stage, m in slowest))
+
+    def open_capture(self):
+        if self.FRAME_READER == 'opencv':
+            return cv2.VideoCapture(self.video_path)
+        if self.FRAME_READER != 'ffmpeg':
+            raise ValueError(f"Unknown frame reader: {self.FRAME_READER}")
+        width = None if self.annotate else self.DECODE_WIDTH
+        # The reader recycles its frame buffers, so the pool covers every frame that can be in flight:
+        # both pipeline queues, the frames pending detection, the up to stride - 1 frames held for
+        # interpolation (a flush can land between keyframes when the motion gate skips some) and one per stage
+        pool_size = 2 * self.PIPELINE_QUEUE_SIZE + self.DETECTION_STRIDE * (self.DETECTION_BATCH_SIZE + 1) + 4
+        start_frame = self.FRAME_RANGE[0] if self.FRAME_RANGE else 0
+        return FFmpegFrameReader(self.video_path, width=width, threads=self.DECODE_THREADS, pool_size=pool_size,
+                                 start_frame=start_frame)
+
+    def run_pipeline(self, cap, out_vid):
+        """Decode, detect and encode in three stages joined by bounded queues.
+
+        Frames are still processed strictly in order by the calling thread, so the
+        annotated video and the events are the same as with the serial loop.
+        """
+        decode_queue = queue.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+        encode_queue = queue.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+        stop = threading.Event()
+        errors = []
+
+        def put(q, item):
+            # Blocks while the queue is full but gives up once the pipeline is stopping
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q):
+            # Returns None once the pipeline is stopping so no stage waits on a dead neighbour
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return None
+
+        def decode():
+            try:
+                for frame in self.read_frames(cap):
+                    if not put(decode_queue, frame):
+                        return
+            except Exception as e:
+                errors.append(e)
+            finally:
+                put(decode_queue, None)
+
+        def encode():
+            try:
+                while True:
+                    frame = encode_queue.get()
+                    if frame is None:
+                        break
+                    with self.timer.time('encode'):
+                        out_vid.write(frame)
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+
+        decoder = threading.Thread(target=decode, name="decoder", daemon=True)
+        writer = threading.Thread(target=encode, name="writer", daemon=True) if out_vid is not None else None
+        decoder.start()
+        if writer is not None:
+            writer.start()
+        def decoded_frames():
+            while True:
+                frame = get(decode_queue)
+                if frame is None:
+                    return
+                yield frame
+
+        try:
+            for frame in self.process_frames(decoded_frames()):
+                if writer is not None and not put(encode_queue, frame):
+                    break
+        except Exception:
+            stop.set()
+            raise
+        finally:
+            # The writer always gets its sentinel so every processed frame is flushed
+            while writer is not None and writer.is_alive():
+                try:
+                    encode_queue.put(None, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if writer is not None:
+                writer.join()
+            stop.set()
+            decoder.join()
+
+        if errors:
+            raise errors[0]
+
+    def read_frames(self, cap):
+        start, stop = self.FRAME_RANGE if self.FRAME_RANGE else (0, None)
+        if start and isinstance(cap, cv2.VideoCapture):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)  # the ffmpeg reader is opened at the start frame instead
+        position = start
+        timer = self.timer
+        while cap.isOpened() and (stop is None or position < stop):
+            with timer.time('decode'):
+                ret, frame = cap.read()
             if not ret:
                 break
-            
-            results = self.model.track(frame, conf=0.3, tracker="bytetrack.yaml")
-            if not results or len(results[0].boxes) == 0:
-                out_vid.write(frame)
-                frame_idx += 1
+            position += 1
+            yield frame
+
+    def process_frames(self, frames):
+        """Yield every frame, in order, after detection, the behaviour rules and annotation.
+
+        With a detection stride above 1 the frames between two keyframes are held back
+        until the next keyframe has been tracked, then processed with interpolated boxes.
+        The rules still see every frame, so frame-based thresholds keep their meaning.
+        """
+        held_frames = []
+        previous = None
+        for frame, keyframe, detections in self._plan_detections(frames):
+            if not keyframe:
+                held_frames.append(frame)
                 continue
-
-            boxes = results[0].boxes
-            ids = boxes.id.cpu().numpy().astype(int)
-            xyxys = boxes.xyxy.cpu().numpy().astype(int)
-            classes = boxes.cls.cpu().numpy().astype(int)
-            scores = boxes.conf.cpu().numpy()
-
-            cow_boxes = []
-            head_boxes = []
-            brush_boxes = []
-            tub_boxes = []
-
-            for i in range(len(ids)):
-                cls = classes[i]
-                bbox = xyxys[i]
-                tid = ids[i]
-
-                if cls == 0:
-                    brush_boxes.append((tid, bbox))
-                    # Update brush motion history
-                    centroid = calculate_centroid(bbox)
-                    history = self.brush_motion_history.setdefault(tid, [])
-                    history.append(centroid)
-                    if len(history) > self.MOTION_HISTORY_LENGTH:
-                        history.pop(0)
-                elif cls == 1:
-                    cow_boxes.append((tid, bbox))
-                elif cls == 2 and scores[i] > 0.5:
-                    head_boxes.append((tid, bbox))
-                elif cls == 3:
-                    tub_boxes.append(bbox)
-
-            for _, head_box in head_boxes:
-                cv2.rectangle(frame, (head_box[0], head_box[1]), (head_box[2], head_box[3]), (255, 255, 102), 2)
-                cv2.putText(frame, "Cow Head", (head_box[0], head_box[1]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 102), 2)
-            for _, brush_box in brush_boxes:
-                cv2.rectangle(frame, (brush_box[0], brush_box[1]), (brush_box[2], brush_box[3]), (255, 0, 0), 2)
-                cv2.putText(frame, "Brush", (brush_box[0], brush_box[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
-
-            for tid, bbox in cow_boxes:
-                cow_img = frame[bbox[1]:bbox[3], bbox[0]:bbox[2]]
-                if cow_img.size != 0:
-                    cnn_id = self.predict_cow_id(cow_img)
-                    self.track_to_cnn_id[tid] = cnn_id
+            if detections is None:
+                # Static scene: keep the previous boxes and tracker state
+                detections = previous
+            yield from self._flush_held_frames(held_frames, previous, detections)
+            self.process_detections(frame, detections)
+            yield frame
+            previous = detections
+
+        if held_frames:
+            # Track the last frame so the tail of the video is interpolated too
+            last_frame = held_frames.pop()
+            detections = self.detect(last_frame)
+            yield from self._flush_held_frames(held_frames, previous, detections)
+            self.process_detections(last_frame, detections)
+            yield last_frame
+
+    def _plan_detections(self, frames):
+        """Yield (frame, is_keyframe, detections) in order; detections is None where none were run.
+
+        Keyframes that need the detector are collected until DETECTION_BATCH_SIZE of them
+        (or DETECTION_BATCH_SIZE strides of frames) are waiting, then detected together.
+        With a batch size of 1 every keyframe is detected as soon as it arrives.
+        """
+        pending = []
+        to_detect = []
+        first = True
+        max_pending = self.DETECTION_STRIDE * self.DETECTION_BATCH_SIZE
+        for position, frame in enumerate(frames):
+            keyframe = position % self.DETECTION_STRIDE == 0
+            entry = [frame, keyframe, None]
+            pending.append(entry)
+            if keyframe:
+                scene_changed = self.motion_gate is None or self.motion_gate.should_detect(frame)
+                if first or scene_changed:
+                    to_detect.append(entry)
+                    first = False
+            if len(to_detect) >= self.DETECTION_BATCH_SIZE or len(pending) >= max_pending:
+                for entry, detections in zip(to_detect, self.detect_batch([e[0] for e in to_detect])):
+                    entry[2] = detections
+                yield from (tuple(e) for e in pending)
+                pending.clear()
+                to_detect.clear()
+        for entry, detections in zip(to_detect, self.detect_batch([e[0] for e in to_detect])):
+            entry[2] = detections
+        yield from (tuple(e) for e in pending)
+
+    def _flush_held_frames(self, held_frames, start, end):
+        steps = len(held_frames) + 1
+        for i, held in enumerate(held_frames, start=1):
+            self.process_detections(held, interpolate_detections(start, end, i / steps))
+            yield held
+        held_frames.clear()
+
+    def detect_batch(self, frames):
+        """Detections for each frame, in order"""
+        if self.batched_tracker is None or not frames:
+            return [self.detect(frame) for frame in frames]
+        self.detection_calls += len(frames)
+        offsets = [(0, 0)] * len(frames)
+        if self.roi is not None:
+            frames, offsets = zip(*(self.roi.crop(frame) for frame in frames))
+        with self.timer.time('detect'):
+            batch = self.batched_tracker.track(list(frames))
+        self.timer.count('detections', sum(len(detections.ids) for detections in batch))
+        sx, sy = self.frame_scale
+        return [
+            scale_detections(offset_detections(detections, *offset), 1 / sx, 1 / sy)
+            for detections, offset in zip(batch, offsets)
+        ]
+
+    def detect(self, frame):
+        """Run the tracker on one frame and return its Detections"""
+        if self.batched_tracker is not None:
+            return self.detect_batch([frame])[0]
+        self.detection_calls += 1
+        offset = (0, 0)
+        if self.roi is not None:
+            frame, offset = self.roi.crop(frame)
+        with self.timer.time('detect'):
+            results = self.model.track(frame, conf=0.3, tracker="bytetrack.yaml", persist=True, verbose=self.verbose)
+        if not results or len(results[0].boxes) == 0 or results[0].boxes.id is None:
+            return empty_detections()
+
+        boxes = results[0].boxes
+        self.timer.count('detections', len(boxes))
+        detections = Detections(
+            ids=boxes.id.cpu().numpy().astype(int),
+            xyxys=boxes.xyxy.cpu().numpy().astype(int),
+            classes=boxes.cls.cpu().numpy().astype(int),
+            scores=boxes.conf.cpu().numpy()
+        )
+        detections = offset_detections(detections, *offset)
+        sx, sy = self.frame_scale
+        return scale_detections(detections, 1 / sx, 1 / sy)
+
+    def process_detections(self, frame, detections):
+        """Apply the behaviour rules to one frame's detections and annotate the frame in place"""
+        # The rules stage is whatever is left of the frame once classifying and drawing are taken out
+        timer = self.timer
+        nested_before = timer.seconds('classify') + timer.seconds('draw')
+        start = time.perf_counter()
+        self._process_detections(frame, detections)
+        nested = timer.seconds('classify') + timer.seconds('draw') - nested_before
+        timer.add('rules', time.perf_counter() - start - nested)
+        timer.count('frames')
+
+    def _process_detections(self, frame, detections):
+        if len(detections.ids) == 0:
+            self.frame_idx += 1
+            return
+        if self.record_activity:
+            # Per-frame view for stitching chunks; filled in as the rules below run
+            brushing_ids, drinking_ids = set(), set()
+            self.activity[self.frame_idx] = (brushing_ids, drinking_ids)
+            self.cow_tracks[self.frame_idx] = {
+                int(tid): tuple(int(v) for v in bbox) for tid, bbox, cls in zip(detections.ids, detections.xyxys, detections.classes) if cls == 1
+            }
+
+        ids, xyxys, classes, scores = detections
+
+        cow_boxes = []
+        head_boxes = []
+        brush_boxes = []
+        tub_boxes = []
+        # Row indices into xyxys for each class, used to read blocks of the geometry matrices
+        cow_idx = []
+        head_idx = []
+        brush_idx = []
+        tub_idx = []
+
+        for i in range(len(ids)):
+            cls = classes[i]
+            bbox = xyxys[i]
+            tid = ids[i]
+
+            if cls == 0:
+                brush_boxes.append((tid, bbox))
+                brush_idx.append(i)
+                # Update brush motion history
+                self.brush_motion.update(tid, calculate_centroid(bbox), self.frame_idx)
+            elif cls == 1:
+                cow_boxes.append((tid, bbox))
+                cow_idx.append(i)
+            elif cls == 2 and scores[i] > 0.5:
+                head_boxes.append((tid, bbox))
+                head_idx.append(i)
+            elif cls == 3:
+                tub_boxes.append(bbox)
+                tub_idx.append(i)
+
+        self.brush_motion.evict_stale(self.frame_idx)
+
+        # Pairwise distances, overlaps and containment for every box of the frame in one go
+        geometry = FrameGeometry(xyxys)
+        # Index into head_boxes of the first head inside each cow, -1 if none
+        cow_head = geometry.first_inside(head_idx, cow_idx)
+
+        timer = self.timer
+        if self.annotate:
+            with timer.time('draw'):
+                for _, head_box in head_boxes:
+                    cv2.rectangle(frame, (head_box[0], head_box[1]), (head_box[2], head_box[3]), (255, 255, 102), 2)
+                    cv2.putText(frame, "Cow Head", (head_box[0], head_box[1]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 102), 2)
+                for _, brush_box in brush_boxes:
+                    cv2.rectangle(frame, (brush_box[0], brush_box[1]), (brush_box[2], brush_box[3]), (255, 0, 0), 2)
+                    cv2.putText(frame, "Brush", (brush_box[0], brush_box[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
+
+        # Collect the crops of tracks without a settled identity so the classifier runs once for the whole frame
+        valid_cows = []
+        pending_cows = []
+        cow_imgs = []
+        sx, sy = self.frame_scale
+        for tid, bbox in cow_boxes:
+            x1, y1, x2, y2 = bbox
+            if sx != 1 or sy != 1:
+                # Boxes are in source pixels, the frame may have been resized by the decoder
+                x1, x2 = int(x1 * sx), int(x2 * sx)
+                y1, y2 = int(y1 * sy), int(y2 * sy)
+            cow_img = frame[y1:y2, x1:x2]
+            if cow_img.size != 0:
+                valid_cows.append((tid, bbox))
+                if not self.identity_cache.lookup(tid, bbox, self.frame_idx):
+                    pending_cows.append(tid)
+                    cow_imgs.append(cow_img)
+
+        if cow_imgs:
+            with timer.time('classify'):
+                probabilities = self.predict_cow_probabilities(cow_imgs)
+            timer.count('classifier_calls')
+            timer.count('classified_crops', len(cow_imgs))
+            for tid, cow_probabilities in zip(pending_cows, probabilities):
+                self.identity_cache.add_vote(tid, cow_probabilities, self.frame_idx)
+
+        for tid, bbox in valid_cows:
+            self.track_to_cnn_id[tid] = self.identity_cache.get(tid)
+        if self.annotate:
+            with timer.time('draw'):
+                for tid, bbox in valid_cows:
                     label = f"cow - {tid}"
                     cv2.rectangle(frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (0, 255, 0), 2)
                     cv2.putText(frame, label, (bbox[0], bbox[1]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
-            # Brushing detection with motion filtering and event merging
-            brushing_cows_current_frame = set()
-            for tid, cow_box in cow_boxes:
-                cow_centroid = calculate_centroid(cow_box)
-                # Check if cow is near a moving brush
-                is_brushing = False
-                for brush_tid, brush in brush_boxes:
-                    brush_moving = self.is_brush_moving(brush_tid)
-                    distance_close = calculate_centroid_distance(cow_centroid, calculate_centroid(brush)) < self.BRUSHING_DISTANCE_THRESHOLD
-                    overlap, area = are_boxes_overlapping(cow_box, brush)
-                    overlap_sufficient = overlap and area > self.OVERLAP_THRESHOLD
-                    
-                    if (distance_close or overlap_sufficient) and brush_moving:
-                        is_brushing = True
-                        break
-                
-                if is_brushing:
+        # Brushing detection with motion filtering and event merging
+        brushing_cows_current_frame = set()
+        if cow_boxes and brush_boxes:
+            # A cow is brushing when it is close to or overlaps a brush that is moving; motion is checked once per brush
+            brush_moving = np.array([self.is_brush_moving(brush_tid) for brush_tid, _ in brush_boxes])
+            distance_close = geometry.distances(cow_idx, brush_idx) < self.BRUSHING_DISTANCE_THRESHOLD
+            overlap_sufficient = geometry.overlaps(cow_idx, brush_idx) > self.OVERLAP_THRESHOLD
+            is_brushing = ((distance_close | overlap_sufficient) & brush_moving[None, :]).any(axis=1)
+
+            for (tid, cow_box), brushing in zip(cow_boxes, is_brushing):
+                if brushing:
                     brushing_cows_current_frame.add(tid)
-                    cv2.putText(frame, f"Brushing", (cow_box[0], cow_box[1]-30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 165, 255), 2)
-            
-            # Update brushing states with event merging logic
-            all_known_cow_ids = set(self.brushing_states.keys()).union([tid for tid, _ in cow_boxes])
-            for cow_id in all_known_cow_ids:
-                is_brushing_now = cow_id in brushing_cows_current_frame
-                
-                if cow_id not in self.brushing_states:
-                    self.brushing_states[cow_id] = {
-                        'merged_event_start_frame': None,
-                        'last_active_segment_end_frame': None,
-                        'is_active_in_previous_frame': False
-                    }
-                
-                state = self.brushing_states[cow_id]
-                
-                if is_brushing_now:
-                    if not state['is_active_in_previous_frame']:
-                        # Starting or restarting brushing
-                        if state['merged_event_start_frame'] is None:
-                            # Brand new event
-                            state['merged_event_start_frame'] = frame_idx
-                        elif state['last_active_segment_end_frame'] is not None:
-                            # Check if we should merge or start new event
-                            gap_frames = frame_idx - state['last_active_segment_end_frame'] - 1
-                            if gap_frames > MERGE_THRESHOLD_FRAMES:
-                                # Gap too large, finalize old event and start new
-                                duration_seconds = (state['last_active_segment_end_frame'] - state['merged_event_start_frame'] + 1) / self.fps
-                                if duration_seconds >= 1.0:
-                                    clean_tid = str(int(cow_id))
-                                    event_key = f"{clean_tid}_{state['merged_event_start_frame']}"
-                                    if event_key not in self.logged_brushing:
-                                        self.db.insert_cow_events_data(
-                                            clean_tid, 'Brushing', round(duration_seconds, 2),
-                                            os.path.basename(self.video_path), date_str, time_str, cam_str,
-                                            round(duration_seconds, 2), None
-                                        )
-                                        self.logged_brushing.add(event_key)
-                                state['merged_event_start_frame'] = frame_idx
-                    
-                    state['is_active_in_previous_frame'] = True
-                    state['last_active_segment_end_frame'] = frame_idx
-                else:
-                    # Not brushing this frame
-                    state['is_active_in_previous_frame'] = False
-                    
-                    # Check if we should finalize the event
-                    if state['merged_event_start_frame'] is not None and state['last_active_segment_end_frame'] is not None:
-                        gap_frames = frame_idx - state['last_active_segment_end_frame'] - 1
-                        if gap_frames > FINALIZE_EVENT_GAP_FRAMES:
-                            # Finalize the event
-                            duration_seconds = (state['last_active_segment_end_frame'] - state['merged_event_start_frame'] + 1) / self.fps
-                            if duration_seconds >= 1.0:
-                                clean_tid = str(int(cow_id))
-                                event_key = f"{clean_tid}_{state['merged_event_start_frame']}"
-                                if event_key not in self.logged_brushing:
-                                    self.db.insert_cow_events_data(
-                                        clean_tid, 'Brushing', round(duration_seconds, 2),
-                                        os.path.basename(self.video_path), date_str, time_str, cam_str,
-                                        round(duration_seconds, 2), None
-                                    )
-                                    self.logged_brushing.add(event_key)
-                            state['merged_event_start_frame'] = None
-
-            # Drinking detection with improved thresholds and event merging
-            drinking_cows_current_frame = set()
-            for tid, cow_box in cow_boxes:
-                # Find matching head if available
-                head_box = None
-                for _, hbox in head_boxes:
-                    if self.is_inside(hbox, cow_box):
-                        head_box = hbox
-                        break
-                
-                # Use improved thresholds
-                det_box = head_box if head_box is not None else cow_box
-                threshold = self.DRINKING_OVERLAP_THRESHOLD_HEAD if head_box is not None else self.DRINKING_OVERLAP_THRESHOLD_COW
-                
-                drinking_near = False
-                for tub in tub_boxes:
-                    overlap, area = are_boxes_overlapping(det_box, tub)
-                    if overlap and area > threshold:
-                        drinking_near = True
+                    if self.annotate:
+                        with timer.time('draw'):
+                            cv2.putText(frame, f"Brushing", (cow_box[0], cow_box[1]-30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 165, 255), 2)
+        
+        # Update brushing events with merging logic
+        self.brushing_segmenter.update(self.frame_idx, brushing_cows_current_frame)
+        if self.record_activity:
+            brushing_ids.update(int(tid) for tid in brushing_cows_current_frame)
+
+        # Drinking detection with improved thresholds and event merging
+        drinking_cows_current_frame = set()
+        if cow_boxes and tub_boxes:
+            # Use the matching head box if available, with its own threshold
+            det_idx = [head_idx[h] if h >= 0 else c for c, h in zip(cow_idx, cow_head)]
+            thresholds = np.where(cow_head >= 0, self.DRINKING_OVERLAP_THRESHOLD_HEAD, self.DRINKING_OVERLAP_THRESHOLD_COW)
+            tub_overlapping = geometry.overlaps(det_idx, tub_idx) > thresholds[:, None]
+        else:
+            tub_overlapping = np.zeros((len(cow_boxes), 0), dtype=bool)
+
+        for (tid, cow_box), overlapping in zip(cow_boxes, tub_overlapping):
+            if overlapping.any():
+                drinking_cows_current_frame.add(tid)
+                if self.annotate:
+                    with timer.time('draw'):
+                        tub = tub_boxes[int(overlapping.argmax())]
                         cv2.rectangle(frame, (tub[0], tub[1]), (tub[2], tub[3]), (0, 255, 255), 2)
                         cv2.putText(frame, "Water Tub", (tub[0], tub[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 2)
-                        break
-                
-                if drinking_near:
-                    drinking_cows_current_frame.add(tid)
-                    cv2.putText(frame, f"Drinking", (cow_box[0], cow_box[1]-50), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-                    cv2.rectangle(frame, (cow_box[0], cow_box[1]), (cow_box[2], cow_box[3]), (255, 255, 0), 2)
-            
-            # Update drinking states with event merging logic
-            all_known_cow_ids_drinking = set(self.drinking_states.keys()).union([tid for tid, _ in cow_boxes])
-            for cow_id in all_known_cow_ids_drinking:
-                is_drinking_now = cow_id in drinking_cows_current_frame
-                
-                if cow_id not in self.drinking_states:
-                    self.drinking_states[cow_id] = {
-                        'merged_event_start_frame': None,
-                        'last_active_segment_end_frame': None,
-                        'is_active_in_previous_frame': False
-                    }
-                
-                d_state = self.drinking_states[cow_id]
-                
-                if is_drinking_now:
-                    if not d_state['is_active_in_previous_frame']:
-                        # Starting or restarting drinking
-                        if d_state['merged_event_start_frame'] is None:
-                            # Brand new event
-                            d_state['merged_event_start_frame'] = frame_idx
-                        elif d_state['last_active_segment_end_frame'] is not None:
-                            # Check if we should merge or start new event
-                            gap_frames = frame_idx - d_state['last_active_segment_end_frame'] - 1
-                            if gap_frames > MERGE_THRESHOLD_FRAMES:
-                                # Gap too large, finalize old event and start new
-                                duration_frames = d_state['last_active_segment_end_frame'] - d_state['merged_event_start_frame'] + 1
-                                if duration_frames >= self.DRINKING_MIN_FRAMES:
-                                    duration_seconds = duration_frames / self.fps
-                                    clean_tid = str(int(cow_id))
-                                    event_key = f"{clean_tid}_{d_state['merged_event_start_frame']}"
-                                    if event_key not in self.logged_drinking:
-                                        self.db.insert_cow_events_data(
-                                            clean_tid, 'Drinking', round(duration_seconds, 2),
-                                            os.path.basename(self.video_path), date_str, time_str, cam_str,
-                                            round(duration_seconds, 2), None
-                                        )
-                                        self.logged_drinking.add(event_key)
-                                d_state['merged_event_start_frame'] = frame_idx
-                    
-                    d_state['is_active_in_previous_frame'] = True
-                    d_state['last_active_segment_end_frame'] = frame_idx
-                else:
-                    # Not drinking this frame
-                    d_state['is_active_in_previous_frame'] = False
-                    
-                    # Check if we should finalize the event
-                    if d_state['merged_event_start_frame'] is not None and d_state['last_active_segment_end_frame'] is not None:
-                        gap_frames = frame_idx - d_state['last_active_segment_end_frame'] - 1
-                        if gap_frames > FINALIZE_EVENT_GAP_FRAMES:
-                            # Finalize the event
-                            duration_frames = d_state['last_active_segment_end_frame'] - d_state['merged_event_start_frame'] + 1
-                            if duration_frames >= self.DRINKING_MIN_FRAMES:
-                                duration_seconds = duration_frames / self.fps
-                                clean_tid = str(int(cow_id))
-                                event_key = f"{clean_tid}_{d_state['merged_event_start_frame']}"
-                                if event_key not in self.logged_drinking:
-                                    self.db.insert_cow_events_data(
-                                        clean_tid, 'Drinking', round(duration_seconds, 2),
-                                        os.path.basename(self.video_path), date_str, time_str, cam_str,
-                                        round(duration_seconds, 2), None
-                                    )
-                                    self.logged_drinking.add(event_key)
-                            d_state['merged_event_start_frame'] = None
-
-            # Headbutt detection
-            current_cows = []
-            velocities = {}
-            matched_heads = {}
-
-            for cow_id, cow_box in cow_boxes:
-                matched = False
-                for head_id, head_box in head_boxes:
-                    if self.is_inside(head_box, cow_box):
-                        hx = (head_box[0] + head_box[2]) // 2
-                        hy = (head_box[1] + head_box[3]) // 2
-                        headpt = (hx, hy)
-                        matched_heads[cow_id] = headpt
-                        matched = True
-
-                        if cow_id in old_head_positions:
-                            vx = headpt[0] - old_head_positions[cow_id][0]
-                            vy = headpt[1] - old_head_positions[cow_id][1]
-                        else:
-                            vx, vy = 0, 0
-
-                        speed = np.sqrt(vx ** 2 + vy ** 2)
-                        velocities[cow_id] = (vx, vy, speed)
-                        old_head_positions[cow_id] = headpt
-
-                        current_cows.append((cow_id, cow_box, headpt))
-                        break
-                if not matched:
-                    continue
-
-            pairs_this_frame = []
-            for i in range(len(current_cows)):
-                for j in range(i + 1, len(current_cows)):
-                    idA, boxA, headA = current_cows[i]
-                    idB, boxB, headB = current_cows[j]
-
-                    (vxA, vyA, spA) = velocities[idA]
-                    cxB = (boxB[0] + boxB[2]) // 2
-                    cyB = (boxB[1] + boxB[3]) // 2
-                    dx = cxB - headA[0]
-                    dy = cyB - headA[1]
-                    dotA = vxA * dx + vyA * dy
-                    closeA = self.is_point_near_body(headA, boxB, buffer=self.HEAD_DISTANCE)
-
-                    (vxB, vyB, spB) = velocities[idB]
-                    cxA = (boxA[0] + boxA[2]) // 2
-                    cyA = (boxA[1] + boxA[3]) // 2
-                    dxB = cxA - headB[0]
-                    dyB = cyA - headB[1]
-                    dotB = vxB * dxB + vyB * dyB
-                    closeB = self.is_point_near_body(headB, boxA, buffer=self.HEAD_DISTANCE)
-
-                    pair_key = tuple(sorted((idA, idB)))
-                    headbutt_A = closeA and spA >= self.MIN_NUDGE_SPEED and dotA > self.DOT_PRODUCT_MIN
-                    headbutt_B = closeB and spB >= self.MIN_NUDGE_SPEED and dotB > self.DOT_PRODUCT_MIN
-
-                    cnn_id_A = self.track_to_cnn_id.get(idA, idA)
-                    cnn_id_B = self.track_to_cnn_id.get(idB, idB)
-                    cnn_pair_key = tuple(sorted((cnn_id_A, cnn_id_B)))
-
-                    if (headbutt_A or headbutt_B) and cnn_pair_key not in self.logged_headbutts:
-                        time_s = round(frame_idx / self.fps, 2)
-                        self.headbutt_log.append({
-                            "cow_1": cnn_id_A,
-                            "cow_2": cnn_id_B,
-                            "time": time_s,
-                            "video_name": filename,
-                            "video_date": date_str,
-                            "video_time": time_str,
-                            "camera": cam_str
-                        })
-                        headbutt_pair_id = f"{idA}-{idB}"
-                        self.db.insert_cow_events_data(
-                            headbutt_pair_id,
-                            'Headbutt',
-                            time_s,
-                            os.path.basename(self.video_path),
-                            date_str,
-                            time_str,
-                            cam_str,
-                            None,
-                            time_s
-                        )
-                        self.logged_headbutts.add(cnn_pair_key)
-                        pairs_this_frame.append(((idA, boxA, headA), (idB, boxB, headB), time_s))
-                        # Highlight both cows involved in headbutt
+                        cv2.putText(frame, f"Drinking", (cow_box[0], cow_box[1]-50), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+                        cv2.rectangle(frame, (cow_box[0], cow_box[1]), (cow_box[2], cow_box[3]), (255, 255, 0), 2)
+        
+        # Update drinking events with merging logic
+        self.drinking_segmenter.update(self.frame_idx, drinking_cows_current_frame)
+        if self.record_activity:
+            drinking_ids.update(int(tid) for tid in drinking_cows_current_frame)
+
+        # Headbutt detection
+        current_cows = []
+        velocities = {}
+        matched_heads = {}
+
+        for (cow_id, cow_box), h in zip(cow_boxes, cow_head):
+            if h < 0:
+                continue
+            head_box = head_boxes[h][1]
+            hx = (head_box[0] + head_box[2]) // 2
+            hy = (head_box[1] + head_box[3]) // 2
+            headpt = (hx, hy)
+            matched_heads[cow_id] = headpt
+
+            if cow_id in self.old_head_positions:
+                vx = headpt[0] - self.old_head_positions[cow_id][0]
+                vy = headpt[1] - self.old_head_positions[cow_id][1]
+            else:
+                vx, vy = 0, 0
+
+            speed = np.sqrt(vx ** 2 + vy ** 2)
+            velocities[cow_id] = (vx, vy, speed)
+            self.old_head_positions[cow_id] = headpt
+
+            current_cows.append((cow_id, cow_box, headpt))
+
+        pairs_this_frame = []
+        # Only pairs whose head and body can actually be within HEAD_DISTANCE are compared
+        candidate_pairs = head_body_candidate_pairs(
+            [box for _, box, _ in current_cows], [head for _, _, head in current_cows], self.HEAD_DISTANCE
+        )
+        for i, j in candidate_pairs:
+            idA, boxA, headA = current_cows[i]
+            idB, boxB, headB = current_cows[j]
+
+            (vxA, vyA, spA) = velocities[idA]
+            cxB = (boxB[0] + boxB[2]) // 2
+            cyB = (boxB[1] + boxB[3]) // 2
+            dx = cxB - headA[0]
+            dy = cyB - headA[1]
+            dotA = vxA * dx + vyA * dy
+            closeA = self.is_point_near_body(headA, boxB, buffer=self.HEAD_DISTANCE)
+
+            (vxB, vyB, spB) = velocities[idB]
+            cxA = (boxA[0] + boxA[2]) // 2
+            cyA = (boxA[1] + boxA[3]) // 2
+            dxB = cxA - headB[0]
+            dyB = cyA - headB[1]
+            dotB = vxB * dxB + vyB * dyB
+            closeB = self.is_point_near_body(headB, boxA, buffer=self.HEAD_DISTANCE)
+
+            pair_key = tuple(sorted((idA, idB)))
+            headbutt_A = closeA and spA >= self.MIN_NUDGE_SPEED and dotA > self.DOT_PRODUCT_MIN
+            headbutt_B = closeB and spB >= self.MIN_NUDGE_SPEED and dotB > self.DOT_PRODUCT_MIN
+
+            cnn_id_A = self.track_to_cnn_id.get(idA, idA)
+            cnn_id_B = self.track_to_cnn_id.get(idB, idB)
+            cnn_pair_key = tuple(sorted((cnn_id_A, cnn_id_B)))
+
+            if (headbutt_A or headbutt_B) and cnn_pair_key not in self.logged_headbutts:
+                time_s = round(self.frame_idx / self.fps, 2)
+                self.headbutt_log.append({
+                    "cow_1": cnn_id_A,
+                    "cow_2": cnn_id_B,
+                    "time": time_s,
+                    "video_name": self.filename,
+                    "video_date": self.date_str,
+                    "video_time": self.time_str,
+                    "camera": self.cam_str,
+                    "frame": self.frame_idx,
+                    "tracks": (int(idA), int(idB))
+                })
+                headbutt_pair_id = f"{idA}-{idB}"
+                self.record_event(
+                    headbutt_pair_id,
+                    'Headbutt',
+                    time_s,
+                    None,
+                    time_s,
+                    start_frame=self.frame_idx,
+                    end_frame=self.frame_idx
+                )
+                self.logged_headbutts.add(cnn_pair_key)
+                pairs_this_frame.append(((idA, boxA, headA), (idB, boxB, headB), time_s))
+                # Highlight both cows involved in headbutt
+                if self.annotate:
+                    with timer.time('draw'):
                         cv2.rectangle(frame, (boxA[0], boxA[1]), (boxA[2], boxA[3]), (0, 0, 255), 2)
                         cv2.rectangle(frame, (boxB[0], boxB[1]), (boxB[2], boxB[3]), (0, 0, 255), 2)
                         cv2.putText(frame, f"Headbutt", (boxA[0], boxA[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
                         cv2.putText(frame, f"Headbutt", (boxB[0], boxB[1] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
 
-                        print(f" Detected headbutt between {idA} and {idB} at {time_s}s")
-
-
-            out_vid.write(frame) 
-            frame_idx += 1
-            frame_count += 1
-
-        # Finalize any remaining events at end of video
-        for cow_id, state in self.brushing_states.items():
-            if state['merged_event_start_frame'] is not None and state['last_active_segment_end_frame'] is not None:
-                duration_seconds = (state['last_active_segment_end_frame'] - state['merged_event_start_frame'] + 1) / self.fps
-                if duration_seconds >= 1.0:
-                    clean_tid = str(int(cow_id))
-                    event_key = f"{clean_tid}_{state['merged_event_start_frame']}"
-                    if event_key not in self.logged_brushing:
-                        self.db.insert_cow_events_data(
-                            clean_tid, 'Brushing', round(duration_seconds, 2),
-                            os.path.basename(self.video_path), date_str, time_str, cam_str,
-                            round(duration_seconds, 2), None
-                        )
-                        self.logged_brushing.add(event_key)
-        
-        for cow_id, d_state in self.drinking_states.items():
-            if d_state['merged_event_start_frame'] is not None and d_state['last_active_segment_end_frame'] is not None:
-                duration_frames = d_state['last_active_segment_end_frame'] - d_state['merged_event_start_frame'] + 1
-                if duration_frames >= self.DRINKING_MIN_FRAMES:
-                    duration_seconds = duration_frames / self.fps
-                    clean_tid = str(int(cow_id))
-                    event_key = f"{clean_tid}_{d_state['merged_event_start_frame']}"
-                    if event_key not in self.logged_drinking:
-                        self.db.insert_cow_events_data(
-                            clean_tid, 'Drinking', round(duration_seconds, 2),
-                            os.path.basename(self.video_path), date_str, time_str, cam_str,
-                            round(duration_seconds, 2), None
-                        )
-                        self.logged_drinking.add(event_key)
-        
-        cap.release()
-        out_vid.release()
-        print(f"Opened video: {self.video_path}")
-        print(f" Inference completed. Total frames processed: {frame_count}")
-
-        def fix_video_for_browser(original_path):
-            # Create a fixed output path
-            fixed_path = original_path.replace('.mp4', '_fixed.mp4')
-            
-            # Run ffmpeg to re-encode
-            cmd = [
-                'ffmpeg', '-y', 
-                '-i', original_path,
-                '-c:v', 'libx264',
-                '-c:a', 'aac',
-                '-movflags', '+faststart',
-                fixed_path
-            ]
-            
-            try:
-                subprocess.run(cmd, check=True)
-                print(f"Video fixed and saved to: {fixed_path}")
-            except subprocess.CalledProcessError as e:
-                print(f"Failed to fix video: {e}")
-
-        fix_video_for_browser(self.output_path)
-
-        with open("headbutt_events.csv", "w", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=["cow_1", "cow_2", "time", "video_name", "video_date", "video_time", "camera"])
-            writer.writeheader()
-            for event in self.headbutt_log:
-                writer.writerow({
-                    "cow_1": event["cow_1"],
-                    "cow_2": event["cow_2"],
-                    "time": event["time"],  
-                    "video_name": event["video_name"],
-                    "video_date": event["video_date"],
-                    "video_time": event["video_time"],
-                    "camera": event["camera"]
-                })
-    
-
+                if self.verbose:
+                    print(f" Detected headbutt between {idA} and {idB} at {time_s}s")
+
+
+        self.frame_idx += 1
+        self.frame_count += 1
+
+    def record_event(self, cow_id, event_type, event_value, event_duration, event_time, start_frame=None, end_frame=None):
+        if self.store_events:
+            sink = self.event_writer.write if self.event_writer is not None else self.db.insert_cow_events_data
+            sink(
+                cow_id, event_type, event_value,
+                os.path.basename(self.video_path), self.date_str, self.time_str, self.cam_str,
+                event_duration, event_time
+            )
+        self.events.append({
+            'cow_id': cow_id,
+            'event_type': event_type,
+            'event_value': event_value,
+            'start_frame': start_frame,
+            'end_frame': end_frame
+        })
+
+    def finalize_events(self):
+        """Log the events that are still open at the end of the video"""
+        self.brushing_segmenter.flush()
+        self.drinking_segmenter.flush()
+
+    def log_segment(self, event_type, logged, cow_id, start_frame, end_frame):
+        """EventSegmenter callback: store one merged brushing or drinking event"""
+        duration_seconds = (end_frame - start_frame + 1) / self.fps
+        clean_tid = str(int(cow_id))
+        event_key = f"{clean_tid}_{start_frame}"
+        if event_key not in logged:
+            self.record_event(
+                clean_tid, event_type, round(duration_seconds, 2), round(duration_seconds, 2), None,
+                start_frame=start_frame, end_frame=end_frame
+            )
+            logged.add(event_key)
 
-        print(" Inference complete, video annotated, and headbutts saved to CSV and DB.")
 
 if __name__ == "__main__":
     video_path = r"Backend\\no_individual_tracking\\Event20240626151811002.mp4"
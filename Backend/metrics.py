@@ -0,0 +1,126 @@
+"""Per-stage timing of an Inference run, and the process-wide aggregate served by /metrics"""
+import bisect
+import contextlib
+import threading
+import time
+
+# Upper bounds in seconds of the per-call stage latency histograms, and of the per-video wall time
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+VIDEO_BUCKETS = (10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0, 3600.0)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.total += other.total
+        self.count += other.count
+
+
+class StageTimer:
+    """Wall time, call count and latency histogram per stage, plus plain counters, for one video.
+
+    Each stage is only timed from one thread (decode in the decoder, encode in the
+    writer, the rest in the processing loop), so no locking is needed.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+
+    def add(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def seconds(self, stage):
+        histogram = self.histograms.get(stage)
+        return histogram.total if histogram is not None else 0.0
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self, frames):
+        stages = {}
+        for stage, histogram in self.histograms.items():
+            stages[stage] = {
+                'seconds': round(histogram.total, 4),
+                'calls': histogram.count,
+                'ms_per_frame': round(histogram.total / frames * 1000, 3) if frames else None,
+            }
+        return {'stages': stages, 'counters': dict(self.counters)}
+
+
+class MetricsRegistry:
+    """Stage histograms and counters summed over every video this process has run"""
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.video_seconds = Histogram(VIDEO_BUCKETS)
+        self._lock = threading.Lock()
+
+    def record_video(self, timer, elapsed):
+        with self._lock:
+            for stage, histogram in timer.histograms.items():
+                self.histograms.setdefault(stage, Histogram()).merge(histogram)
+            for name, n in timer.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            self.counters['videos'] = self.counters.get('videos', 0) + 1
+            self.video_seconds.observe(elapsed)
+
+    @staticmethod
+    def _histogram_lines(name, histogram, labels=''):
+        lines = []
+        cumulative = 0
+        for bound, n in zip(histogram.buckets + ('+Inf',), histogram.counts):
+            cumulative += n
+            le = bound if isinstance(bound, str) else repr(bound)
+            lines.append(f'{name}_bucket{{{labels}le="{le}"}} {cumulative}')
+        braces = f'{{{labels.rstrip(",")}}}' if labels else ''
+        lines.append(f'{name}_sum{braces} {histogram.total}')
+        lines.append(f'{name}_count{braces} {histogram.count}')
+        return lines
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                '# HELP cow_inference_stage_seconds Time per call of each inference stage',
+                '# TYPE cow_inference_stage_seconds histogram',
+            ]
+            for stage in sorted(self.histograms):
+                lines += self._histogram_lines('cow_inference_stage_seconds', self.histograms[stage], f'stage="{stage}",')
+            lines += [
+                '# HELP cow_inference_video_seconds Wall time of each processed video',
+                '# TYPE cow_inference_video_seconds histogram',
+            ]
+            lines += self._histogram_lines('cow_inference_video_seconds', self.video_seconds)
+            for name in sorted(self.counters):
+                lines += [f'# TYPE cow_inference_{name}_total counter', f'cow_inference_{name}_total {self.counters[name]}']
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
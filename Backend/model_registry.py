@@ -0,0 +1,133 @@
+"""Process-wide cache of the detector and classifier, so each set of weights is loaded once per process"""
+import contextlib
+import threading
+import time
+import numpy as np
+from ultralytics import YOLO
+from classificationmodel import CowClassifier, OnnxCowClassifier, ScriptedCowClassifier
+
+# Model files per runtime backend; the onnx ones are written by export_models.py,
+# the int8 classifier (TorchScript) by quantize_classifier.py
+ARTIFACTS = {
+    'torch': {
+        'detector': 'Backend/models/yolov8/last_trained_best.pt',
+        'classifier': 'Backend/models/classifier/best_model.pth',
+    },
+    'onnx': {
+        'detector': 'Backend/models/yolov8/last_trained_best.onnx',
+        'classifier': 'Backend/models/classifier/best_model.onnx',
+    },
+    'int8': {
+        'detector': 'Backend/models/yolov8/last_trained_best.pt',
+        'classifier': 'Backend/models/classifier/best_model_int8.pt',
+    },
+}
+DETECTOR_PATH = ARTIFACTS['torch']['detector']
+CLASSIFIER_PATH = ARTIFACTS['torch']['classifier']
+
+
+def artifact_paths(backend):
+    if backend not in ARTIFACTS:
+        raise ValueError(f"Unknown backend: {backend} (expected one of {sorted(ARTIFACTS)})")
+    return ARTIFACTS[backend]
+
+
+class ModelRegistry:
+    """Loads each model on first use and hands the same instance to every Inference.
+
+    The YOLO model carries the ByteTrack state of the video it is tracking, so a
+    video must run inside detector_session(): it holds the model's lock for the
+    whole video and starts from a fresh tracker. warm_up() loads the default
+    models and runs one dummy forward pass through each; ready() reports when
+    that has finished.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._model_locks = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.error = None
+        self.warmup_seconds = {}
+
+    def _get(self, key, load):
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                start = time.perf_counter()
+                model = self._models[key] = load()
+                self._model_locks[id(model)] = threading.Lock()
+                print(f" Loaded {key[0]} {key[1]} in {time.perf_counter() - start:.2f}s")
+            return model
+
+    def detector(self, path=DETECTOR_PATH, mode='track'):
+        """The YOLO model for path; mode 'track' for model.track(), 'predict' for plain batched predict().
+
+        The two never share an instance: once track() has run, Ultralytics keeps its
+        tracking callbacks on the model and every later predict() tracks as well.
+        """
+        if mode not in ('track', 'predict'):
+            raise ValueError(f"Unknown detector mode: {mode}")
+        # Ultralytics runs .onnx weights through ONNX Runtime itself, with the same track() interface
+        return self._get(('detector', path, mode), lambda: YOLO(path, task='detect'))
+
+    def classifier(self, path=CLASSIFIER_PATH, batch_size=32):
+        if path.endswith('.onnx'):
+            classifier_class = OnnxCowClassifier
+        elif path.endswith('.pt'):
+            classifier_class = ScriptedCowClassifier
+        else:
+            classifier_class = CowClassifier  # .pth state dict
+        return self._get(('classifier', path, batch_size), lambda: classifier_class(path, batch_size=batch_size))
+
+    @staticmethod
+    def reset_tracker(model):
+        """Drop the tracker state left by the previous video (persist=True keeps it between calls)"""
+        predictor = getattr(model, 'predictor', None)
+        for tracker in getattr(predictor, 'trackers', None) or []:
+            tracker.reset()
+
+    @contextlib.contextmanager
+    def detector_session(self, model):
+        with self._model_locks.get(id(model)) or contextlib.nullcontext():
+            self.reset_tracker(model)
+            yield model
+
+    def warm_up(self, backend='torch', frame_size=(640, 640)):
+        try:
+            detector_path = artifact_paths(backend)['detector']
+            classifier_path = artifact_paths(backend)['classifier']
+            start = time.perf_counter()
+            detector = self.detector(detector_path)
+            with self._model_locks[id(detector)]:
+                detector.predict(np.zeros((frame_size[1], frame_size[0], 3), dtype=np.uint8), verbose=False)
+            self.warmup_seconds['detector'] = round(time.perf_counter() - start, 2)
+
+            start = time.perf_counter()
+            self.classifier(classifier_path).predict([np.zeros((224, 224, 3), dtype=np.uint8)])
+            self.warmup_seconds['classifier'] = round(time.perf_counter() - start, 2)
+            self._ready.set()
+        except Exception as e:
+            self.error = e
+            print(f" Model warm-up failed: {e}")
+
+    def start_warm_up(self, **kwargs):
+        thread = threading.Thread(target=self.warm_up, kwargs=kwargs, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def ready(self):
+        return self._ready.is_set()
+
+    def status(self):
+        with self._lock:
+            loaded = sorted(f"{key[0]}:{key[1]}" for key in self._models)
+        return {
+            'ready': self.ready(),
+            'loaded': loaded,
+            'warmup_seconds': dict(self.warmup_seconds),
+            'error': str(self.error) if self.error is not None else None,
+        }
+
+
+MODELS = ModelRegistry()
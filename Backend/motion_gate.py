@@ -0,0 +1,59 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Cheap check in front of the tracker that flags frames which barely changed.
+
+    Each frame is converted to a small grayscale image and compared with a running
+    background (exponential moving average). When the mean absolute difference,
+    on a 0-255 scale, stays below threshold the caller can reuse the previous
+    detections. A detection is forced at least every refresh_interval frames so
+    the tracker never goes stale for too long.
+    """
+
+    def __init__(self, threshold=2.0, refresh_interval=30, width=160, background_rate=0.05):
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        self.width = width
+        self.background_rate = background_rate
+        self.background = None
+        self.frames_since_detection = 0
+        self.last_change = 0.0
+        self.checked = 0
+        self.skipped = 0
+
+    def _downscale(self, frame):
+        h, w = frame.shape[:2]
+        height = max(1, int(round(h * self.width / w)))
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (self.width, height), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def should_detect(self, frame):
+        """Return True if the frame has to go through the tracker"""
+        self.checked += 1
+        small = self._downscale(frame)
+        if self.background is None or self.background.shape != small.shape:
+            self.background = small
+            self.frames_since_detection = 0
+            return True
+
+        self.last_change = float(cv2.absdiff(small, self.background).mean())
+        cv2.accumulateWeighted(small, self.background, self.background_rate)
+
+        self.frames_since_detection += 1
+        if self.last_change >= self.threshold or self.frames_since_detection >= self.refresh_interval:
+            self.frames_since_detection = 0
+            return True
+        self.skipped += 1
+        return False
+
+    def skip_fraction(self):
+        return self.skipped / self.checked if self.checked else 0.0
+
+    def stats(self):
+        return {
+            'checked': self.checked,
+            'skipped': self.skipped,
+            'skip_fraction': round(self.skip_fraction(), 4),
+        }
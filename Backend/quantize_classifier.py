@@ -0,0 +1,176 @@
+"""Post-training int8 quantization of CowIdentificationModel for CPU inference.
+
+    python Backend/quantize_classifier.py --calibration-dir static/cow_crops --mode static
+
+static: the conv/bn/relu stack is fused and quantized with observers calibrated on
+cow crops; the SE block and the linear layers are quantized dynamically.
+dynamic: only the linear layers are quantized (no calibration needed, small gain).
+
+The result is saved as TorchScript at ARTIFACTS['int8']['classifier'] and loaded
+by Inference(backend='int8'). A report with top-1 agreement, latency, runtime
+memory (RSS added by loading the model and predicting a batch) and file size
+against the fp32 model is written next to it.
+"""
+import argparse
+import concurrent.futures
+import glob
+import io
+import json
+import multiprocessing
+import os
+import time
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao import quantization as tq
+from classificationmodel import CowClassifier, ScriptedCowClassifier, load_cow_model
+from model_registry import ARTIFACTS
+from resource_governor import RSSMonitor
+
+# (conv, bn, relu) triplets in CowIdentificationModel.features
+FUSE_GROUPS = [['0', '1', '2'], ['4', '5', '6'], ['8', '9', '10'], ['11', '12', '13'], ['14', '15', '16']]
+
+
+class QuantizableCowModel(nn.Module):
+    """CowIdentificationModel with quant/dequant stubs around the conv features"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.quant = tq.QuantStub()
+        self.features = model.features
+        self.dequant = tq.DeQuantStub()
+        self.se_block = model.se_block
+        self.global_avg_pool = model.global_avg_pool
+        self.classifier = model.classifier
+
+    def forward(self, x):
+        x = self.dequant(self.features(self.quant(x)))
+        x = self.se_block(x)
+        x = self.global_avg_pool(x)
+        x = x.view(x.size(0), -1)
+        return self.classifier(x)
+
+
+def set_quantized_engine():
+    engines = torch.backends.quantized.supported_engines
+    torch.backends.quantized.engine = 'x86' if 'x86' in engines else ('fbgemm' if 'fbgemm' in engines else 'qnnpack')
+    return torch.backends.quantized.engine
+
+
+def load_crops(folder, limit=None):
+    paths = sorted(p for ext in ('jpg', 'jpeg', 'png') for p in glob.glob(os.path.join(folder, '**', f'*.{ext}'), recursive=True))
+    crops = [image for image in (cv2.imread(p) for p in paths[:limit]) if image is not None]
+    if not crops:
+        raise ValueError(f"No cow crops found in {folder}")
+    return crops
+
+
+def quantize(weights_path, calibration_crops=None, mode='static'):
+    """int8 copy of the classifier; calibration_crops (BGR) are needed for static mode"""
+    engine = set_quantized_engine()
+    model = load_cow_model(weights_path)
+    if mode == 'dynamic':
+        return tq.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    if mode != 'static':
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    if not calibration_crops:
+        raise ValueError("Static quantization needs calibration crops")
+
+    model = QuantizableCowModel(model).eval()
+    tq.fuse_modules(model.features, FUSE_GROUPS, inplace=True)
+    # Only the conv stack gets static int8; the dequant stub needs the qconfig too, or convert leaves it
+    # an identity and the SE block (float multiply, dynamic linears) receives a quantized tensor
+    model.qconfig = None
+    qconfig = tq.get_default_qconfig(engine)
+    model.quant.qconfig = model.features.qconfig = model.dequant.qconfig = qconfig
+    tq.prepare(model, inplace=True)
+
+    calibrator = CowClassifier()
+    with torch.no_grad():
+        for start in range(0, len(calibration_crops), calibrator.batch_size):
+            model(calibrator.preprocess(calibration_crops[start:start + calibrator.batch_size]))
+    tq.convert(model, inplace=True)
+    return tq.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def save_scripted(model, path):
+    scripted = torch.jit.trace(model, torch.zeros(1, 3, 224, 224))
+    torch.jit.save(scripted, path)
+    return path
+
+
+def serialized_size(model):
+    buffer = io.BytesIO()
+    torch.jit.save(torch.jit.trace(model, torch.zeros(1, 3, 224, 224)), buffer)
+    return buffer.tell()
+
+
+def _latency_ms(classifier, crops, repeats=3):
+    classifier.predict(crops[:classifier.batch_size])  # warm-up
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        classifier.predict(crops)
+        best = min(best, time.perf_counter() - start)
+    return best / len(crops) * 1000
+
+
+def _load_and_predict_mb(variant, path, crops):
+    """RSS a fresh process adds by loading one variant and predicting one batch"""
+    with RSSMonitor(interval=0.01) as rss:
+        classifier = CowClassifier(path) if variant == 'fp32' else ScriptedCowClassifier(path)
+        classifier.predict(crops[:classifier.batch_size])
+    return rss.increase_mb
+
+
+def runtime_memory_mb(variant, path, crops):
+    # Own process per variant: in a shared one the second model would reuse the first one's freed memory
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(_load_and_predict_mb, variant, path, crops).result()
+
+
+def compare(fp32_weights, int8_path, eval_crops):
+    """Top-1 agreement, per-crop latency, runtime memory and model size of the int8 model against fp32"""
+    fp32 = CowClassifier(fp32_weights)
+    int8 = ScriptedCowClassifier(int8_path)
+    agreement = float(np.mean(np.array(fp32.predict(eval_crops)) == np.array(int8.predict(eval_crops))))
+    report = {
+        'eval_crops': len(eval_crops),
+        'top1_agreement': agreement,
+        'fp32_ms_per_crop': _latency_ms(fp32, eval_crops),
+        'int8_ms_per_crop': _latency_ms(int8, eval_crops),
+        'fp32_memory_mb': runtime_memory_mb('fp32', fp32_weights, eval_crops),
+        'int8_memory_mb': runtime_memory_mb('int8', int8_path, eval_crops),
+        'fp32_size_bytes': serialized_size(fp32.model),
+        'int8_size_bytes': os.path.getsize(int8_path),
+    }
+    report['speedup'] = report['fp32_ms_per_crop'] / report['int8_ms_per_crop']
+    report['memory_ratio'] = report['int8_memory_mb'] / report['fp32_memory_mb'] if report['fp32_memory_mb'] else None
+    report['size_ratio'] = report['int8_size_bytes'] / report['fp32_size_bytes']
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Quantize the cow classifier to int8")
+    parser.add_argument('--calibration-dir', help="folder of cow crop images, used for calibration and the report")
+    parser.add_argument('--mode', choices=('static', 'dynamic'), default='static')
+    parser.add_argument('--calibration-size', type=int, default=256, help="crops used for calibration, the rest for the report")
+    parser.add_argument('--weights', default=ARTIFACTS['torch']['classifier'])
+    parser.add_argument('--output', default=ARTIFACTS['int8']['classifier'])
+    args = parser.parse_args()
+
+    crops = load_crops(args.calibration_dir) if args.calibration_dir else []
+    calibration, evaluation = crops[:args.calibration_size], crops[args.calibration_size:] or crops
+    quantized = quantize(args.weights, calibration, mode=args.mode)
+    save_scripted(quantized, args.output)
+    print(f" int8 classifier ({args.mode}) saved to {args.output}")
+
+    if evaluation:
+        report = dict(compare(args.weights, args.output, evaluation), mode=args.mode)
+        with open(os.path.splitext(args.output)[0] + '_report.json', 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f" top-1 agreement {report['top1_agreement']:.1%}, {report['fp32_ms_per_crop']:.2f} -> "
+              f"{report['int8_ms_per_crop']:.2f} ms/crop, memory {report['fp32_memory_mb']:.0f} -> "
+              f"{report['int8_memory_mb']:.0f} MB, file {report['fp32_size_bytes'] / 1e6:.1f} -> "
+              f"{report['int8_size_bytes'] / 1e6:.1f} MB")
@@ -0,0 +1,173 @@
+"""Thread, CPU and memory budgets for Inference jobs that share one host"""
+import os
+import threading
+
+
+def available_cpus():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # not on Linux
+        return list(range(os.cpu_count() or 1))
+
+
+def apply_thread_budget(threads, cpus=None):
+    """Limit torch, OpenCV and BLAS to threads and optionally pin the process to cpus.
+
+    torch's intra-op pool and OpenCV's pool are process-wide, so this is meant for
+    a worker process that runs one job at a time.
+    """
+    # The environment only reaches pools that have not started yet, so set it before the imports
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(threads)
+    import cv2
+    import torch
+
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):  # AttributeError: no os.sysconf on Windows
+        pass
+    try:
+        import resource  # Unix only
+    except ImportError:
+        return 0.0  # Windows: unknown, so the job memory estimate stays at its default
+    # Not Linux: fall back to the peak, the best the platform gives us
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RSSMonitor:
+    """Samples the process RSS in a background thread and keeps the peak seen while running.
+
+    increase_mb is the peak above the RSS at entry, i.e. what the job itself added.
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.start_mb = 0.0
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+            if self._stop.wait(self.interval):
+                return
+
+    @property
+    def increase_mb(self):
+        return max(0.0, self.peak_mb - self.start_mb)
+
+    def __enter__(self):
+        self.start_mb = self.peak_mb = current_rss_mb()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rss-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+        return False
+
+
+class ResourceBusy(Exception):
+    pass
+
+
+class JobLease:
+    __slots__ = ('threads', 'cpus', 'memory_mb')
+
+    def __init__(self, threads, cpus, memory_mb):
+        self.threads = threads
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+
+
+class ResourceGovernor:
+    """Hands out thread/CPU/memory leases to concurrent Inference jobs.
+
+    Each job gets cpus // max_jobs threads and, with pin_cpus, its own set of CPUs.
+    max_jobs > 1 is for jobs in separate processes (batch_inference): jobs in one
+    process share the cached models, and detector_session serializes them per video.
+    A job is admitted while the estimated memory of all running jobs stays within
+    memory_budget_mb (None means no limit). The estimate starts at job_memory_mb
+    and follows the largest peak RSS reported through release(). With
+    policy='queue' acquire() waits for room; with 'refuse' it raises ResourceBusy.
+    """
+
+    def __init__(self, max_jobs=1, memory_budget_mb=None, job_memory_mb=1500, pin_cpus=False, policy='queue', cpus=None):
+        if policy not in ('queue', 'refuse'):
+            raise ValueError(f"Unknown policy: {policy}")
+        self.cpus = list(cpus) if cpus is not None else available_cpus()
+        self.max_jobs = max(1, max_jobs)
+        self.threads_per_job = max(1, len(self.cpus) // self.max_jobs)
+        self.memory_budget_mb = memory_budget_mb
+        self.job_memory_mb = job_memory_mb
+        self.pin_cpus = pin_cpus
+        self.policy = policy
+        self.free_cpus = list(self.cpus)
+        self.active = []
+        self.peak_rss_mb = {}  # job name -> peak RSS reported on release
+        self._condition = threading.Condition()
+
+    def _fits(self):
+        if len(self.active) >= self.max_jobs:
+            return False
+        if self.memory_budget_mb is None:
+            return True
+        used = sum(lease.memory_mb for lease in self.active)
+        return used + self.job_memory_mb <= self.memory_budget_mb
+
+    def acquire(self, timeout=None):
+        with self._condition:
+            if self.memory_budget_mb is not None and self.job_memory_mb > self.memory_budget_mb:
+                raise ResourceBusy(f"A job needs about {self.job_memory_mb:.0f} MB, more than the {self.memory_budget_mb} MB budget")
+            if not self._fits():
+                if self.policy == 'refuse':
+                    raise ResourceBusy(f"{len(self.active)} jobs running, no room for another")
+                if not self._condition.wait_for(self._fits, timeout):
+                    raise ResourceBusy(f"No room for another job after {timeout}s")
+            cpus = None
+            if self.pin_cpus:
+                cpus, self.free_cpus = self.free_cpus[:self.threads_per_job], self.free_cpus[self.threads_per_job:]
+            lease = JobLease(self.threads_per_job, cpus, self.job_memory_mb)
+            self.active.append(lease)
+            return lease
+
+    def try_acquire(self):
+        """A lease if one is free right now, else None (whatever the policy)"""
+        try:
+            return self.acquire(timeout=0)
+        except ResourceBusy:
+            return None
+
+    def release(self, lease, name=None, peak_rss_mb=None):
+        with self._condition:
+            self.active.remove(lease)
+            if lease.cpus:
+                self.free_cpus = sorted(self.free_cpus + lease.cpus)
+            if peak_rss_mb:
+                if name is not None:
+                    self.peak_rss_mb[name] = peak_rss_mb
+                self.job_memory_mb = max(self.job_memory_mb, peak_rss_mb)
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'active_jobs': len(self.active),
+                'max_jobs': self.max_jobs,
+                'threads_per_job': self.threads_per_job,
+                'memory_budget_mb': self.memory_budget_mb,
+                'job_memory_estimate_mb': round(self.job_memory_mb, 1),
+                'peak_rss_mb': dict(self.peak_rss_mb),
+            }
@@ -0,0 +1,82 @@
+import json
+import os
+import cv2
+import numpy as np
+
+
+class CameraROI:
+    """Region of a camera's view where cows, brushes and tubs can appear.
+
+    Given either a rectangle [x1, y1, x2, y2] or a polygon [[x, y], ...] in
+    full-frame pixels. Frames are cropped to the bounding rectangle before
+    detection. With a polygon, the pixels outside it are also blacked out.
+    """
+
+    def __init__(self, rect=None, polygon=None):
+        if rect is None and polygon is None:
+            raise ValueError("CameraROI needs a rect or a polygon")
+        self.polygon = np.array(polygon, dtype=np.int32) if polygon is not None else None
+        if rect is None:
+            x, y, w, h = cv2.boundingRect(self.polygon)
+            rect = [x, y, x + w, y + h]
+        self.rect = [int(v) for v in rect]
+        self._frame_shape = None
+        self._bounds = None
+        self._mask = None
+
+    def scaled(self, sx, sy):
+        """The same region for frames resized by (sx, sy)"""
+        if self.polygon is not None:
+            return CameraROI(polygon=np.rint(self.polygon * np.array([sx, sy])).astype(np.int32))
+        x1, y1, x2, y2 = self.rect
+        return CameraROI(rect=[int(round(x1 * sx)), int(round(y1 * sy)), int(round(x2 * sx)), int(round(y2 * sy))])
+
+    def _prepare(self, frame_shape):
+        h, w = frame_shape[:2]
+        x1, y1, x2, y2 = self.rect
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(w, x2), min(h, y2)
+        if x2 <= x1 or y2 <= y1:
+            x1, y1, x2, y2 = 0, 0, w, h
+        self._bounds = (x1, y1, x2, y2)
+        self._mask = None
+        if self.polygon is not None:
+            mask = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+            cv2.fillPoly(mask, [self.polygon - np.array([x1, y1], dtype=np.int32)], 255)
+            self._mask = mask
+        self._frame_shape = frame_shape
+
+    def crop(self, frame):
+        """Return the cropped detector input and the (dx, dy) offset back to the full frame"""
+        if self._frame_shape != frame.shape:
+            self._prepare(frame.shape)
+        x1, y1, x2, y2 = self._bounds
+        cropped = frame[y1:y2, x1:x2]
+        if self._mask is not None:
+            cropped = cv2.bitwise_and(cropped, cropped, mask=self._mask)
+        return cropped, (x1, y1)
+
+
+# Next to this file, so it is the same file whatever directory the app is started from
+CAMERA_ROI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'camera_rois.json')
+
+
+def load_camera_rois(path=CAMERA_ROI_PATH):
+    """Regions of interest per camera from a JSON file; no file means no ROIs.
+
+    Keys are the camera strings of the video names (the last three digits of
+    EventYYYYMMDDhhmmssCCC.mp4). Each value is a rectangle [x1, y1, x2, y2], or
+    {"rect": [x1, y1, x2, y2]} or {"polygon": [[x, y], ...]}, in full-frame
+    pixels. See camera_rois.example.json.
+    """
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        config = json.load(f)
+    rois = {}
+    for cam, roi in config.items():
+        if isinstance(roi, list):
+            rois[cam] = CameraROI(rect=roi)
+        else:
+            rois[cam] = CameraROI(rect=roi.get('rect'), polygon=roi.get('polygon'))
+    return rois
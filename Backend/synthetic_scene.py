@@ -0,0 +1,169 @@
+"""Scripted barn scenes for benchmarks: moving boxes rendered to a video, and a stub detector that replays them.
+
+ScriptedInference runs the real Inference pipeline (decode, rules, classifier,
+drawing, encoding, database) with the detector replaced by the script, so it
+needs neither the YOLO weights nor the trained classifier.
+"""
+import contextlib
+import math
+import cv2
+import numpy as np
+import torch
+from classificationmodel import CowClassifier
+from detections import Detections, empty_detections
+from inference import Inference
+
+BRUSH_ID = 101
+TUB_ID = 102
+COW_SIZE = (120, 80)
+HEAD_SIZE = 30
+
+# (cow track id, far and near top-left corner, period in frames, side the head is on).
+# Cow 1 swings into the brush, cow 2 dips its head into the tub, cows 3 and 4 walk into each other.
+COW_PATHS = (
+    (1, (220, 40), (55, 25), 240, 'left'),
+    (2, (300, 210), (430, 250), 270, 'right'),
+    (3, (100, 150), (220, 150), 180, 'right'),
+    (4, (460, 150), (320, 150), 180, 'left'),
+)
+CLASS_COLOURS = {0: (200, 60, 60), 1: (40, 40, 40), 2: (150, 150, 150), 3: (60, 200, 200)}
+
+
+def _head_box(x, y, side):
+    w, h = COW_SIZE
+    hx = x + w - HEAD_SIZE if side == 'right' else x
+    hy = y + (h - HEAD_SIZE) // 2
+    if side == 'right' and y > 200:
+        hy = y + h - HEAD_SIZE - 5  # the drinking cow lowers its head into the tub
+    return (hx, hy, hx + HEAD_SIZE, hy + HEAD_SIZE)
+
+
+def scripted_scene(num_frames=600, frame_size=(640, 360)):
+    """Per-frame Detections of a scene in which the brushing, drinking and headbutt rules all fire"""
+    w, h = frame_size
+    tub = (w - 120, h - 80, w - 20, h - 20)
+    script = []
+    for frame_idx in range(num_frames):
+        ids, xyxys, classes, scores = [], [], [], []
+        # The brush swings a few pixels every frame, so it counts as moving
+        shift = 4 if frame_idx % 2 else -4
+        for tid, box, cls in ((BRUSH_ID, (20 + shift, 20, 70 + shift, 70), 0), (TUB_ID, tub, 3)):
+            ids.append(tid)
+            xyxys.append(box)
+            classes.append(cls)
+            scores.append(0.9)
+        for tid, far, near, period, side in COW_PATHS:
+            t = 0.5 - 0.5 * math.cos(2 * math.pi * frame_idx / period)
+            x = int(round(far[0] + (near[0] - far[0]) * t))
+            y = int(round(far[1] + (near[1] - far[1]) * t))
+            ids += [tid, tid + 10]
+            xyxys += [(x, y, x + COW_SIZE[0], y + COW_SIZE[1]), _head_box(x, y, side)]
+            classes += [1, 2]
+            scores += [0.9, 0.8]
+        script.append(Detections(
+            ids=np.array(ids, dtype=int),
+            xyxys=np.array(xyxys, dtype=int),
+            classes=np.array(classes, dtype=int),
+            scores=np.array(scores, dtype=np.float32)
+        ))
+    return script
+
+
+def render_frame(detections, frame_size=(640, 360), seed=0):
+    """Filled boxes on a noisy floor, cows textured per track so their crops differ"""
+    w, h = frame_size
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(80, 100, size=(h, w, 3), dtype=np.uint8)
+    # Bodies first, so the heads stay visible on top
+    for tid, box, cls in sorted(zip(detections.ids, detections.xyxys, detections.classes), key=lambda d: d[2] == 2):
+        x1, y1, x2, y2 = (int(v) for v in box)
+        colour = CLASS_COLOURS.get(int(cls), (0, 0, 0))
+        cv2.rectangle(frame, (x1, y1), (x2, y2), colour, -1)
+        if cls == 1:
+            spot = (int(tid) * 37) % 200 + 40
+            cv2.circle(frame, ((x1 + x2) // 2, (y1 + y2) // 2), 15, (spot, 255 - spot, spot // 2), -1)
+    return frame
+
+
+# (h, w) of cow and head boxes as the detector gives them on 1080p footage: tall, wide, small and square
+CROP_SIZES = ((500, 300), (300, 500), (180, 400), (400, 180), (260, 230), (150, 120), (90, 70), (224, 224), (230, 600))
+
+
+def scene_crops(num_crops=64, seed=0):
+    """BGR crops of the scene's cows at detection-sized boxes, smooth with sensor noise, like real crops"""
+    script = scripted_scene(num_crops)
+    rng = np.random.default_rng(seed)
+    crops = []
+    for i in range(num_crops):
+        frame = cv2.GaussianBlur(render_frame(script[i], seed=i), (0, 0), 1.0)
+        ids = script[i].ids
+        tid = COW_PATHS[i % len(COW_PATHS)][0]
+        x1, y1, x2, y2 = script[i].xyxys[list(ids).index(tid)]
+        h, w = CROP_SIZES[i % len(CROP_SIZES)]
+        crop = cv2.resize(frame[y1:y2, x1:x2], (w, h), interpolation=cv2.INTER_CUBIC).astype(np.float32)
+        crops.append(np.clip(crop + rng.normal(0, 6, crop.shape), 0, 255).astype(np.uint8))
+    return crops
+
+
+def write_scene_video(path, script, frame_size=(640, 360), fps=30):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, frame_size)
+    for frame_idx, detections in enumerate(script):
+        writer.write(render_frame(detections, frame_size, seed=frame_idx))
+    writer.release()
+    return path
+
+
+class ScriptedDetector:
+    """Stands in for the YOLO model: hands out the scripted Detections of a frame index"""
+
+    def __init__(self, script):
+        self.script = script
+
+    def detections_at(self, frame_idx):
+        if not 0 <= frame_idx < len(self.script):
+            return empty_detections()
+        return self.script[frame_idx]
+
+
+class ScriptedModels:
+    """Stands in for model_registry.MODELS: a ScriptedDetector and a CowClassifier with random weights"""
+
+    def __init__(self, script, classifier=None):
+        self.scripted_detector = ScriptedDetector(script)
+        self._classifier = classifier
+
+    def detector(self, path=None, mode='track'):
+        return self.scripted_detector
+
+    def classifier(self, path=None, batch_size=32):
+        if self._classifier is None:
+            torch.manual_seed(0)  # the same random weights in every process, so chunked runs agree on identities
+            self._classifier = CowClassifier(batch_size=batch_size)
+        return self._classifier
+
+    @contextlib.contextmanager
+    def detector_session(self, model):
+        yield model
+
+
+class ScriptedInference(Inference):
+    """Inference whose detector replays script, one entry per frame of video_path.
+
+    Each detect call replays the script entry of the current frame, which is
+    only the frame being detected when every frame is detected, so the detection
+    stride and batch size stay at 1 and the motion gate stays off. A frame_range
+    is fine, which lets chunked_inference run it as a worker.
+    """
+
+    def __init__(self, video_path, script, output_path=None, classifier=None, **kwargs):
+        kwargs.setdefault('camera_rois', {})
+        super().__init__(video_path, output_path, models=ScriptedModels(script, classifier), **kwargs)
+        if self.DETECTION_STRIDE != 1 or self.DETECTION_BATCH_SIZE != 1 or self.MOTION_GATE_THRESHOLD is not None:
+            raise ValueError("ScriptedInference needs detection_stride=1, detection_batch_size=1 and no motion gate")
+
+    def detect(self, frame):
+        self.detection_calls += 1
+        with self.timer.time('detect'):
+            detections = self.model.detections_at(self.frame_idx)
+        self.timer.count('detections', len(detections.ids))
+        return detections
@@ -0,0 +1,30 @@
+"""A worker process that dies must fail only its own videos, not the whole batch"""
+import json
+import os
+import batch_inference
+
+
+def crashing_worker(video_path, summary_dir, output_dir, inference_kwargs, threads=None, cpus=None):
+    """Stands in for run_video: kills its process on the 'crash' video, finishes the others at once"""
+    if 'crash' in os.path.basename(video_path):
+        os._exit(1)
+    summary = {'video': video_path, 'status': 'done', 'frames': 1, 'throughput_fps': 1.0, 'events': {}, 'peak_rss_mb': 1.0}
+    batch_inference.write_summary(batch_inference.summary_path(summary_dir, video_path), summary)
+    return summary
+
+
+def test_dead_worker_fails_its_video_and_the_batch_goes_on(tmp_path):
+    names = ['Event20240101120000001.mp4', 'Event20240101120000002_crash.mp4', 'Event20240101120000003.mp4']
+    for name in names:
+        (tmp_path / name).touch()
+    summary_dir = tmp_path / 'summaries'
+
+    exit_code = batch_inference.main([str(tmp_path), '--workers', '1', '--summary-dir', str(summary_dir),
+                                      '--output-dir', str(tmp_path / 'out')], worker=crashing_worker)
+
+    with open(summary_dir / 'batch_summary.json') as f:
+        batch = json.load(f)
+    statuses = {os.path.basename(s['video']): s['status'] for s in batch['summaries']}
+    assert exit_code == 1
+    assert statuses == {names[0]: 'done', names[1]: 'failed', names[2]: 'done'}
+    assert 'BrokenProcessPool' in batch_inference.load_summary(str(summary_dir), str(tmp_path / names[1]))['error']
@@ -0,0 +1,46 @@
+"""BatchedByteTracker has to give the same track ids as model.track(persist=True), frame by frame"""
+import numpy as np
+import torch
+from ultralytics import YOLO
+from ultralytics.engine.results import Results
+from ultralytics.models.yolo.detect.predict import DetectionPredictor
+from byte_tracking import BatchedByteTracker
+
+# A cow for 10 frames, gone for longer than bytetrack.yaml's track_buffer (30), then back in the same place
+SCRIPT = [[(100, 100, 300, 250)]] * 10 + [[]] * 45 + [[(100, 100, 300, 250)]] * 10
+
+
+def scripted_frames():
+    frames = []
+    for frame_idx in range(len(SCRIPT)):
+        frame = np.zeros((360, 640, 3), dtype=np.uint8)
+        frame[0, 0, 0] = frame_idx  # tells the scripted predictor which frame it is looking at
+        frames.append(frame)
+    return frames
+
+
+def scripted_result(self, pred, img, orig_img, img_path):
+    boxes = [box + (0.9, 0) for box in SCRIPT[int(orig_img[0, 0, 0])]]
+    return Results(orig_img, path=img_path, names=self.model.names,
+                   boxes=torch.tensor(boxes, dtype=torch.float32).reshape(-1, 6))
+
+
+def test_track_ids_match_model_track_across_a_long_gap(monkeypatch):
+    # Random weights: the detector's output is replaced by SCRIPT, the trackers are the real ones
+    monkeypatch.setattr(DetectionPredictor, 'construct_result', scripted_result)
+    frames = scripted_frames()
+
+    tracked = YOLO('yolov8n.yaml', task='detect')
+    expected = []
+    for frame in frames:
+        # As Inference.detect calls it
+        boxes = tracked.track(frame, conf=0.3, tracker='bytetrack.yaml', persist=True, verbose=False)[0].boxes
+        expected.append([] if boxes.id is None else boxes.id.int().tolist())
+
+    batched = BatchedByteTracker(YOLO('yolov8n.yaml', task='detect'))
+    actual = []
+    for start in range(0, len(frames), 8):
+        actual += [d.ids.tolist() for d in batched.track(frames[start:start + 8])]
+
+    assert expected[9] and expected[-1] and expected[9] != expected[-1]  # the cow came back as a new track
+    assert actual == expected
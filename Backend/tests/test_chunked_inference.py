@@ -0,0 +1,36 @@
+"""A chunked, stitched run has to find the same events as one sequential run of the video"""
+import os
+from chunked_inference import run_chunked
+from synthetic_scene import ScriptedInference, scripted_scene, write_scene_video
+
+NUM_FRAMES = 900  # 30 s at 30 fps, so three chunks of 10 s each
+CHUNKS = 3
+OVERLAP_SECONDS = 5.0  # Inference.MERGE_EVENT_WITHIN_SECONDS
+
+
+def event_set(events):
+    return sorted((e['event_type'], e['cow_id'], e['start_frame'], e['end_frame']) for e in events)
+
+
+def durations(events):
+    totals = {}
+    for event in events:
+        if event['event_type'] != 'Headbutt':
+            totals[event['event_type']] = round(totals.get(event['event_type'], 0.0) + event['event_value'], 2)
+    return totals
+
+
+def test_chunked_events_match_sequential(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    script = scripted_scene(NUM_FRAMES)
+    video_path = write_scene_video(os.path.join(tmp_path, "Event20240101120000001.mp4"), script)
+
+    sequential = ScriptedInference(video_path, script, analytics_only=True, verbose=False)
+    sequential.store_events = False
+    sequential.inference()
+    chunked = run_chunked(video_path, chunks=CHUNKS, overlap_seconds=OVERLAP_SECONDS, store_events=False,
+                          inference_class=ScriptedInference, script=script, verbose=False)
+
+    assert {e['event_type'] for e in sequential.events} >= {'Brushing', 'Drinking', 'Headbutt'}
+    assert event_set(chunked) == event_set(sequential.events)
+    assert durations(chunked) == durations(sequential.events)
@@ -0,0 +1,9 @@
+"""The Flask app has to start fast and without the ML stack; see check_import_budget"""
+from benchmark import check_import_budget
+
+APP_IMPORT_BUDGET_SECONDS = 1.5
+
+
+def test_app_imports_within_budget_without_heavy_modules():
+    # Raises AssertionError if the import is over budget or pulls in torch, cv2, ultralytics, pandas, ...
+    check_import_budget('app', budget_seconds=APP_IMPORT_BUDGET_SECONDS)
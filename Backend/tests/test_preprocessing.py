@@ -0,0 +1,20 @@
+"""CropPreprocessor has to match the PIL/torchvision transform the classifier was trained with"""
+import torch
+from classificationmodel import CowClassifier
+from synthetic_scene import CROP_SIZES, scene_crops
+
+MEAN_TOLERANCE = 0.02  # of the normalized tensor, i.e. about one grey level
+MAX_TOLERANCE = 0.25
+
+
+def test_fast_preprocessing_matches_torchvision():
+    classifier = CowClassifier(batch_size=16)
+    crops = scene_crops(4 * len(CROP_SIZES))
+    reference = classifier.preprocess_torchvision(crops)
+    # The preprocessor reuses its buffer, so copy each batch out
+    fast = torch.cat([classifier.preprocessor(crops[i:i + 16]).clone() for i in range(0, len(crops), 16)])
+
+    difference = (reference - fast).abs()
+    per_crop = difference.flatten(1).mean(dim=1)
+    assert per_crop.max() <= MEAN_TOLERANCE, f"crop of shape {crops[int(per_crop.argmax())].shape} differs by {per_crop.max():.4f}"
+    assert difference.max() <= MAX_TOLERANCE
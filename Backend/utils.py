@@ -1,3 +1,4 @@
+import csv
 import numpy as np
 import math
 
@@ -66,4 +67,37 @@ def is_present(target_bbox, bboxes_list):
             best_distance = distance
             best_match = bbox
             return True
-    return False
\ No newline at end of file
+    return False
+
+def calculate_iou(bbox1, bbox2):
+    overlap_area = calculate_overlap_area(bbox1, bbox2)
+    area1 = (bbox1[2] - bbox1[0]) * (bbox1[3] - bbox1[1])
+    area2 = (bbox2[2] - bbox2[0]) * (bbox2[3] - bbox2[1])
+    union_area = area1 + area2 - overlap_area
+    if union_area <= 0:
+        return 0.0
+    return overlap_area / union_area
+
+
+def parse_video_name(filename):
+    """Date, time and camera strings encoded in an EventYYYYMMDDhhmmssCCC.mp4 file name"""
+    date_str = filename[5:13]
+    time_str = filename[13:19]
+    cam_str = filename[19:22] if len(filename) >= 22 else '000'
+    return date_str, time_str, cam_str
+
+
+def write_headbutt_csv(path, headbutt_log):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["cow_1", "cow_2", "time", "video_name", "video_date", "video_time", "camera"])
+        writer.writeheader()
+        for event in headbutt_log:
+            writer.writerow({
+                "cow_1": event["cow_1"],
+                "cow_2": event["cow_2"],
+                "time": event["time"],
+                "video_name": event["video_name"],
+                "video_date": event["video_date"],
+                "video_time": event["video_time"],
+                "camera": event["camera"]
+            })
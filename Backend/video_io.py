@@ -0,0 +1,137 @@
+import json
+import subprocess
+import cv2
+import numpy as np
+
+
+def probe_video(path, ffprobe='ffprobe'):
+    """Width, height, fps and frame count of the first video stream, read with ffprobe"""
+    cmd = [
+        ffprobe, '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height,avg_frame_rate,nb_frames', '-of', 'json', path
+    ]
+    stream = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout)['streams'][0]
+    num, _, den = stream.get('avg_frame_rate', '0/1').partition('/')
+    fps = float(num) / float(den or 1) if float(den or 1) else 0.0
+    frame_count = int(stream['nb_frames']) if str(stream.get('nb_frames', '')).isdigit() else 0
+    return int(stream['width']), int(stream['height']), fps, frame_count
+
+
+class FFmpegFrameReader:
+    """Frame source that decodes through an ffmpeg subprocess instead of cv2.VideoCapture.
+
+    Scaling (area filter) and the BGR conversion happen inside ffmpeg, with
+    multithreaded decoding, so full-resolution frames are never copied into Python
+    when a smaller size is asked for. Frames are read straight into a ring of
+    pool_size preallocated buffers. A returned frame therefore stays valid only
+    until pool_size further reads, and the caller must size the pool for every
+    frame it keeps in flight. Has the read/isOpened/get/release interface of
+    cv2.VideoCapture. source_size keeps the original resolution. start_frame seeks
+    before decoding starts.
+    """
+
+    def __init__(self, path, width=None, height=None, threads=0, pool_size=4, start_frame=0, ffmpeg='ffmpeg', ffprobe='ffprobe'):
+        source_w, source_h, self.fps, self.frame_count = probe_video(path, ffprobe)
+        self.source_size = (source_w, source_h)
+        if width and not height:
+            height = int(round(source_h * width / source_w))
+        elif height and not width:
+            width = int(round(source_w * height / source_h))
+        self.size = (int(width), int(height)) if width else self.source_size
+
+        cmd = [ffmpeg, '-v', 'error', '-threads', str(threads)]
+        if start_frame and self.fps:
+            cmd += ['-ss', f'{start_frame / self.fps:.6f}']
+        cmd += ['-i', path, '-an', '-sn']
+        if self.size != self.source_size:
+            cmd += ['-vf', f'scale={self.size[0]}:{self.size[1]}:flags=area']
+        cmd += ['-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+
+        w, h = self.size
+        self._buffers = [np.empty((h, w, 3), dtype=np.uint8) for _ in range(max(1, pool_size))]
+        self._views = [memoryview(buf).cast('B') for buf in self._buffers]
+        self._next = 0
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=w * h * 3)
+
+    def isOpened(self):
+        return self.process is not None
+
+    def read(self):
+        if self.process is None:
+            return False, None
+        view = self._views[self._next]
+        filled = 0
+        while filled < len(view):
+            n = self.process.stdout.readinto(view[filled:])
+            if not n:
+                return False, None
+            filled += n
+        frame = self._buffers[self._next]
+        self._next = (self._next + 1) % len(self._buffers)
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.size[0]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.size[1]
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frame_count
+        return 0
+
+    def release(self):
+        if self.process is None:
+            return
+        self.process.stdout.close()
+        if self.process.poll() is None:
+            self.process.terminate()
+        self.process.wait()
+        self.process = None
+
+
+class FFmpegVideoWriter:
+    """Browser-ready H.264 writer that pipes raw BGR frames into an ffmpeg process.
+
+    Has the same isOpened/write/release interface as cv2.VideoWriter. The output is
+    encoded with libx264 (yuv420p, +faststart) in a single pass, so no second
+    transcode is needed.
+    """
+
+    def __init__(self, path, fps, frame_size, preset='veryfast', crf=23, ffmpeg='ffmpeg'):
+        self.path = path
+        self.frame_size = tuple(frame_size)
+        w, h = self.frame_size
+        cmd = [
+            ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{w}x{h}', '-r', str(fps), '-i', '-',
+            '-an',
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',  # yuv420p needs even dimensions
+            '-c:v', 'libx264', '-preset', preset, '-crf', str(crf), '-pix_fmt', 'yuv420p',
+            '-movflags', '+faststart',
+            path
+        ]
+        try:
+            self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        except FileNotFoundError:
+            print(f" ffmpeg not found ({ffmpeg}), cannot write {path}")
+            self.process = None
+
+    def isOpened(self):
+        return self.process is not None and self.process.poll() is None
+
+    def write(self, frame):
+        if frame.shape[1::-1] != self.frame_size:
+            raise ValueError(f"Frame size {frame.shape[1::-1]} does not match writer size {self.frame_size}")
+        self.process.stdin.write(np.ascontiguousarray(frame).data)
+
+    def release(self):
+        if self.process is None:
+            return
+        if self.process.stdin and not self.process.stdin.closed:
+            self.process.stdin.close()
+        returncode = self.process.wait()
+        self.process = None
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with code {returncode} while writing {self.path}")